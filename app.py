@@ -2,11 +2,30 @@ import streamlit as st
 import pandas as pd
 import os
 import warnings
-from tabs import render_pygwalker_tab, render_plotly_tab, render_echarts_tab
+from tabs import render_pygwalker_tab, render_plotly_tab, render_echarts_tab, render_broadcast_input
+from utils import (
+    assign_fingerprint,
+    dataset_cache,
+    dataset_registry,
+    expression_pool,
+    get_llm_call_stats,
+    get_rollup_cube,
+    llm_jobs,
+    load_csv,
+    mark_sample,
+    render_trace_panel,
+    response_cache,
+    stream_csv,
+    tracer
+)
 
 # Suppress deprecation warnings from dependencies
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
+# Sessions share one DataFrame per dataset (utils/dataset_registry.py); with
+# copy-on-write their views and derived frames copy a column before changing it
+pd.set_option("mode.copy_on_write", True)
+
 # Page configuration
 st.set_page_config(
     page_title="Chat BI - Data Analysis",
@@ -16,27 +35,108 @@ st.set_page_config(
 # Title
 st.title("💬 Chat BI - Data Analysis with AI")
 
+# Question sent to all three tabs; filled in once the dataset is loaded
+broadcast_container = st.container()
+
 # Tabs
 tab1, tab2, tab3 = st.tabs(["📊 PygWalker", "📈 Plotly", "📊 ECharts"])
 
 # File uploader for CSV
 uploaded_file = st.file_uploader("Upload your CSV file", type=['csv'])
 
+# Ingestion options
+st.sidebar.header("📥 Data Loading")
+use_arrow = st.sidebar.checkbox(
+    "Arrow-backed dtypes",
+    value=False,
+    help="Parse with the pyarrow engine and keep columns as Arrow arrays (requires pyarrow)"
+)
+downcast = st.sidebar.checkbox(
+    "Compact numeric columns",
+    value=False,
+    help="Store numbers in the smallest dtype that holds them. Saves memory, but arithmetic in "
+         "chart expressions then stays in that dtype and can overflow (e.g. an int16 ID times 10)"
+)
+LOADING_MODES = {
+    "All rows": None,
+    "Reservoir sample": "reservoir",
+    "First rows + stratified sample": "stratified",
+}
+loading_mode = st.sidebar.selectbox(
+    "Rows kept in memory",
+    list(LOADING_MODES),
+    help="For very large files: stream the CSV in chunks and keep a bounded sample for charting. "
+         "Exact totals are still computed over every row."
+)
+sample_mode = LOADING_MODES[loading_mode]
+row_budget = st.sidebar.number_input(
+    "Row budget",
+    min_value=1_000,
+    value=200_000,
+    step=50_000,
+    disabled=sample_mode is None
+)
+st.sidebar.number_input(
+    "Max points per line/scatter trace",
+    min_value=100,
+    value=2_000,
+    step=500,
+    key="max_chart_points",
+    help="Larger traces are downsampled in the renderer (LTTB for lines, min/max per bucket for markers)"
+)
+
 # Load data
-@st.cache_data
-def load_data(file):
-    if file is not None:
-        df = pd.read_csv(file)
-        return df
-    return None
+def read_dataset(file, key, use_arrow=False, sample_mode=None, row_budget=None, downcast=False):
+    """Load a dataset the shared registry doesn't hold yet, from the disk cache or the CSV itself"""
+    with tracer.span("ingestion", bytes=getattr(file, "size", None)) as span:
+        # Reuse the typed dataset from disk if this exact file was loaded before
+        cached = dataset_cache.load(key)
+        if cached is not None:
+            df, report = cached
+            assign_fingerprint(df, key)
+            mark_sample(df, report)
+            span.set(source="disk_cache", rows=len(df))
+            return df, report
+
+        if sample_mode:
+            progress_bar = st.progress(0.0, text="Reading CSV...")
+            df, report = stream_csv(
+                file,
+                max_rows=row_budget,
+                sample_mode=sample_mode,
+                progress=lambda fraction: progress_bar.progress(fraction, text="Reading CSV..."),
+                downcast=downcast
+            )
+            progress_bar.empty()
+        else:
+            df, report = load_csv(file, use_arrow=use_arrow, downcast=downcast)
+        span.set(source="stream" if sample_mode else "csv", rows=len(df))
+        dataset_cache.store(key, df, report)
+        # The content hash is the fingerprint; it is stored in df.attrs and carried by every view
+        assign_fingerprint(df, key)
+        return df, report
+
+
+def load_data(file, use_arrow=False, sample_mode=None, row_budget=None, downcast=False):
+    """This session's zero-copy view of the dataset, loaded once per process and shared by all sessions"""
+    if file is None:
+        return None, None
+    key = dataset_registry.key_for(
+        file, use_arrow=use_arrow, sample_mode=sample_mode, row_budget=row_budget, downcast=downcast
+    )
+    return dataset_registry.get(key, lambda: read_dataset(file, key, use_arrow, sample_mode, row_budget, downcast))
 
 # Load the dataset
-df = load_data(uploaded_file)
+df, ingestion_report = load_data(uploaded_file, use_arrow, sample_mode, row_budget if sample_mode else None, downcast)
 
 if df is None:
     st.info("👆 Please upload a CSV file to get started")
     st.stop()
 
+# Pre-aggregate once per dataset so groupby charts skip the row scan (shared by all sessions);
+# for a sample the cube comes from the exact statistics over every row
+get_rollup_cube(df, stats=ingestion_report.stats)
+
 # API Configuration in Sidebar
 st.sidebar.header("🤖 AI Configuration")
 api_key_input = st.sidebar.text_input(
@@ -52,18 +152,108 @@ model_choice = st.sidebar.text_input(
     help="Enter the model name (e.g., amazon/nova-2-lite-v1:free, anthropic/claude-3.5-sonnet, openai/gpt-4o)"
 )
 
+st.sidebar.checkbox(
+    "Stream responses",
+    value=True,
+    key="stream_responses",
+    help="Show the answer token by token and render the chart as soon as the spec is complete"
+)
+
+st.sidebar.number_input(
+    "Chat turns sent verbatim",
+    min_value=1,
+    max_value=20,
+    value=3,
+    key="history_turns",
+    help="Earlier answers are sent as one-line summaries instead of full chart specs"
+)
+st.sidebar.checkbox(
+    "Cache responses",
+    value=True,
+    key="cache_responses",
+    help="Reuse earlier answers to the same question about the same dataset and model"
+)
+st.sidebar.checkbox(
+    "Match similar questions",
+    value=False,
+    key="fuzzy_cache",
+    disabled=not st.session_state.get("cache_responses", True),
+    help="Also reuse answers to near-identical questions (e.g. differing only in wording or punctuation)"
+)
+st.sidebar.checkbox(
+    "Performance panel",
+    value=False,
+    key="show_trace_panel",
+    help="Show per-stage timings of recent requests (prompt building, LLM call, evaluation, rendering)"
+)
+
+llm_stats = get_llm_call_stats()
+if llm_stats["calls"]:
+    st.sidebar.caption(
+        f"LLM latency: last {llm_stats['last']:.1f}s · p50 {llm_stats['p50']:.1f}s · "
+        f"p95 {llm_stats['p95']:.1f}s over {llm_stats['calls']} call(s), {llm_stats['retries']} retried"
+    )
+    if llm_stats["first_token_p50"] is not None:
+        st.sidebar.caption(
+            f"Time to first token: p50 {llm_stats['first_token_p50']:.2f}s · "
+            f"last prompt ~{llm_stats['prompt_tokens']:,} tokens"
+        )
+
+job_stats = llm_jobs.stats()
+if job_stats["submitted"]:
+    st.sidebar.caption(
+        f"LLM queue: {job_stats['running']} running, {job_stats['queued']} queued "
+        f"(limit {job_stats['max_concurrency']}, peak {job_stats['peak_queue']}) · "
+        f"wait p95 {job_stats['wait_p95']:.1f}s"
+    )
+
+pool_stats = expression_pool.stats()
+if pool_stats["submitted"]:
+    st.sidebar.caption(
+        f"Expression workers: {pool_stats['busy']} busy, {pool_stats['waiting']} waiting "
+        f"(limit {pool_stats['max_workers']}, peak {pool_stats['peak_waiting']}) · "
+        f"run p95 {pool_stats['run_p95']:.1f}s · {pool_stats['timeouts']} timed out, "
+        f"{pool_stats['memory_stops']} over memory, {pool_stats['cancelled']} cancelled"
+    )
+
+cache_stats = response_cache.stats()
+if cache_stats["hits"] + cache_stats["misses"]:
+    st.sidebar.caption(
+        f"Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['hits']} hit(s), {cache_stats['fuzzy_hits']} similar), "
+        f"~{cache_stats['latency_saved']:.1f}s saved"
+    )
+
 st.sidebar.markdown("---")
 
 # Display basic info
 st.sidebar.header("📊 Dataset Info")
-st.sidebar.write(f"**Total Records:** {len(df):,}")
+st.sidebar.write(f"**Total Records:** {ingestion_report.rows:,}")
+if ingestion_report.sampled:
+    strata = f" by {ingestion_report.stratify_by}" if ingestion_report.stratify_by else ""
+    st.sidebar.write(f"**Rows in Memory:** {len(df):,} ({ingestion_report.sample_mode} sample{strata})")
 st.sidebar.write(f"**Total Columns:** {len(df.columns)}")
+st.sidebar.write(
+    f"**Memory:** {ingestion_report.memory_after / 1e6:,.1f} MB "
+    f"(saved ~{ingestion_report.memory_saved / 1e6:,.1f} MB)"
+)
+registry_stats = dataset_registry.stats()
+st.sidebar.caption(
+    f"🔗 Shared by all sessions: {registry_stats['datasets']} dataset(s), "
+    f"{registry_stats['bytes'] / 1e6:,.1f} MB in memory · {registry_stats['hits']:,} reload(s) avoided"
+)
+if ingestion_report.date_columns:
+    st.sidebar.write(f"**Date Columns:** {', '.join(ingestion_report.date_columns)}")
 
 # Show columns
 with st.sidebar.expander("View Columns"):
     for col in df.columns:
         st.write(f"• {col} ({df[col].dtype})")
 
+if ingestion_report.stats is not None:
+    with st.sidebar.expander("Exact Column Statistics"):
+        st.dataframe(ingestion_report.stats.summary())
+
 st.sidebar.markdown("---")
 
 # Show raw data option
@@ -87,6 +277,9 @@ if "current_echarts_spec" not in st.session_state:
 if "spec_version" not in st.session_state:
     st.session_state.spec_version = 0
 
+with broadcast_container:
+    render_broadcast_input(df, api_key_input, model_choice)
+
 # Render tabs
 with tab1:
     render_pygwalker_tab(df, api_key_input, model_choice)
@@ -96,3 +289,6 @@ with tab2:
 
 with tab3:
     render_echarts_tab(df, api_key_input, model_choice)
+
+if st.session_state.get("show_trace_panel"):
+    render_trace_panel()
@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files stage by stage.
+
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Prints median timings and their ratio for every dataset size and stage
+present in both files; exits with status 1 when a stage got slower than
+--threshold times the baseline (and slower by at least --min-ms).
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold=1.25, min_ms=5.0):
+    """Return (rows, regressions) comparing median stage timings of two result dicts"""
+    rows = []
+    regressions = []
+    for size, dataset in current["datasets"].items():
+        base_stages = baseline["datasets"].get(size, {}).get("stages", {})
+        for stage, summary in dataset["stages"].items():
+            base = base_stages.get(stage, {})
+            if "median" not in summary or "median" not in base:
+                continue
+            ratio = summary["median"] / base["median"] if base["median"] else float("inf")
+            row = (size, stage, base["median"], summary["median"], ratio)
+            rows.append(row)
+            if ratio > threshold and (summary["median"] - base["median"]) * 1000 >= min_ms:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows, regressions = compare(baseline, current, args.threshold, args.min_ms)
+    print(f"{baseline['meta']['commit']} → {current['meta']['commit']}")
+    for size, stage, before, after, ratio in rows:
+        flag = "  ⚠" if (size, stage, before, after, ratio) in regressions else ""
+        print(f"{int(size):>12,}  {stage:<42} {before * 1000:>10.1f} ms → {after * 1000:>10.1f} ms  {ratio:5.2f}x{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than {args.threshold}x the baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
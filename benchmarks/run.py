@@ -0,0 +1,232 @@
+"""
+End-to-end benchmark of the chart pipeline on synthetic supermarket data.
+
+    python -m benchmarks.run --rows 10000 1000000 --repeat 3
+
+Times every stage from CSV loading to chart rendering against a local stub
+OpenRouter server and writes the results as JSON (default
+benchmarks/results/<commit>.json); compare two result files with
+python -m benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import streamlit.logger
+from streamlit import config as streamlit_config
+from utils import (
+    assign_fingerprint,
+    call_llm_api,
+    expression_cache,
+    extract_json_spec,
+    extract_vegalite_spec,
+    fit_to_budget,
+    get_dataset_info,
+    get_dataset_profile,
+    get_rollup_cube,
+    load_csv,
+    render_echarts_chart,
+    render_plotly_chart
+)
+from utils.dates import parsed_dates
+from utils.renderers import MAX_LINE_POINTS, evaluate_python_expressions
+from .stub_server import start_stub_server
+from .synthetic import write_supermarket_csv
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROWS = [10_000, 1_000_000, 10_000_000]
+MODEL = "benchmark/stub"
+
+# Questions asked per chart library; the stub answers each with a canned spec
+QUESTIONS = {
+    "vegalite": {"bar": "Show total sales by region"},
+    "plotly": {"bar": "Show total sales by region", "line": "Show the sales trend over time"},
+    "echarts": {"bar": "Show total sales by category", "line": "Show the sales trend over time"},
+}
+RENDERERS = {"plotly": render_plotly_chart, "echarts": render_echarts_chart}
+
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    """Call fn, appending its duration to timings[stage]; a failure is recorded and returns None"""
+    entry = timings.setdefault(stage, {"seconds": []})
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        entry.setdefault("error", f"{type(e).__name__}: {e}")
+        return None
+    entry["seconds"].append(time.perf_counter() - start)
+    return result
+
+
+def _load(path):
+    # app.load_data on a miss: the disk cache and the shared dataset registry are skipped
+    with open(path, "rb") as f:
+        return load_csv(f)
+
+
+def _build_messages(profile, library, question):
+    system_prompt = profile.system_prompt(library)
+    return fit_to_budget(system_prompt, [{"role": "user", "content": question}])
+
+
+def _clear_caches():
+    expression_cache.clear()
+    parsed_dates.clear()
+
+
+def run_once(path, run_id, api_url, timings):
+    """One pass over every stage for the dataset at path"""
+    loaded = _timed(timings, "load_data", _load, path)
+    if loaded is None:
+        return None
+    df, report = loaded
+    # A new fingerprint per run keeps the profile, prompt and expression caches cold
+    assign_fingerprint(df, f"benchmark-{run_id}-{time.time_ns()}")
+    _clear_caches()
+
+    _timed(timings, "get_dataset_info", get_dataset_info, df)
+    profile = get_dataset_profile(df)
+    # Built at upload in the app; groupby expressions below are answered from it
+    _timed(timings, "build_rollup", get_rollup_cube, df)
+
+    for library, questions in QUESTIONS.items():
+        for kind, question in questions.items():
+            name = f"{library}.{kind}"
+            messages = _timed(timings, f"build_prompt.{name}", _build_messages, profile, library, question)
+            answer = _timed(timings, f"call_llm_api.{name}", call_llm_api, "benchmark-key", MODEL, messages, url=api_url)
+            if answer is None:
+                continue
+
+            if library == "vegalite":
+                _timed(timings, f"extract_vegalite_spec.{name}", extract_vegalite_spec, answer)
+                continue
+
+            spec = _timed(timings, f"extract_json_spec.{name}", extract_json_spec, answer)
+            _clear_caches()
+            _timed(timings, f"evaluate_python_expressions.{name}", evaluate_python_expressions, spec, df)
+            # Expression values are cached by now, so this isolates reduction and serialization
+            _timed(timings, f"render_{library}_chart.{kind}", RENDERERS[library], spec, df, max_points=MAX_LINE_POINTS)
+
+    return report
+
+
+def _summarize(timings):
+    summary = {}
+    for stage, entry in timings.items():
+        seconds = entry["seconds"]
+        summary[stage] = {"runs": len(seconds)}
+        if seconds:
+            summary[stage].update(
+                min=min(seconds),
+                median=statistics.median(seconds),
+                mean=statistics.fmean(seconds),
+                max=max(seconds),
+            )
+        if "error" in entry:
+            summary[stage]["error"] = entry["error"]
+    return summary
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def run_benchmarks(rows_list, repeat=3, seed=0, data_dir=None, latency=0.0):
+    """Run every stage repeat times per dataset size and return the results dict"""
+    data_dir = data_dir or os.path.join(BENCH_DIR, "data")
+    server, base_url = start_stub_server(latency)
+    api_url = base_url + "/chat/completions"
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+            "stub_latency": latency,
+        },
+        "datasets": {},
+    }
+    try:
+        for rows in rows_list:
+            start = time.perf_counter()
+            path = write_supermarket_csv(rows, data_dir, seed=seed)
+            print(f"{rows:>12,} rows: data ready in {time.perf_counter() - start:.1f}s ({path})", file=sys.stderr)
+
+            timings = {}
+            report = None
+            for run in range(repeat):
+                report = run_once(path, f"{rows}-{run}", api_url, timings) or report
+
+            results["datasets"][str(rows)] = {
+                "rows": rows,
+                "csv_bytes": os.path.getsize(path),
+                "memory_bytes": report.memory_after if report else None,
+                "stages": _summarize(timings),
+            }
+            _print_dataset(rows, results["datasets"][str(rows)]["stages"])
+    finally:
+        server.shutdown()
+    return results
+
+
+def _print_dataset(rows, stages):
+    print(f"\n{rows:,} rows", file=sys.stderr)
+    for stage, summary in stages.items():
+        if "median" in summary:
+            line = f"  {stage:<42} {summary['median'] * 1000:>10.1f} ms (min {summary['min'] * 1000:.1f})"
+        else:
+            line = f"  {stage:<42} {'-':>10}"
+        if "error" in summary:
+            line += f"  [{summary['error'][:60]}]"
+        print(line, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Chat BI chart pipeline on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="dataset sizes to run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per dataset size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=None, help="where generated CSVs are kept (default benchmarks/data)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated model latency of the stub server")
+    parser.add_argument("--output", default=None, help="result file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    # Streamlit calls run in bare mode here and would warn about the missing runtime on every
+    # call; the config is loaded first because parsing it resets the log level
+    streamlit_config.get_option("logger.level")
+    streamlit.logger.set_log_level("error")
+    # Same pandas mode as app.py, so .assign() chains cost what they cost in the app
+    pd.set_option("mode.copy_on_write", True)
+
+    results = run_benchmarks(args.rows, args.repeat, args.seed, args.data_dir, args.latency)
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{results['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
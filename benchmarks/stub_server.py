@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Canned answers in the shape each prompt asks for, using supermarket.csv columns
+VEGALITE_SPEC = """Sales are highest in the West region.
+{
+  "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+  "mark": "bar",
+  "encoding": {
+    "x": {"field": "Region", "type": "nominal"},
+    "y": {"field": "Sales", "type": "quantitative", "aggregate": "sum"}
+  }
+}"""
+
+PLOTLY_SPECS = {
+    "bar": """{
+  "data": [{
+    "type": "bar",
+    "x": df.groupby("Region")["Sales"].sum().index.tolist(),
+    "y": df.groupby("Region")["Sales"].sum().values.tolist(),
+    "name": "Sales"
+  }],
+  "layout": {"title": "Sales by Region", "xaxis": {"title": "Region"}, "yaxis": {"title": "Sales"}}
+}""",
+    "line": """{
+  "data": [{
+    "type": "scatter",
+    "mode": "lines+markers",
+    "x": df.assign(_temp_date=pd.to_datetime(df["Order Date"], errors='coerce', dayfirst=True)).sort_values("_temp_date")["_temp_date"].dt.strftime("%Y-%m-%d").tolist(),
+    "y": df.assign(_temp_date=pd.to_datetime(df["Order Date"], errors='coerce', dayfirst=True)).sort_values("_temp_date")["Sales"].tolist(),
+    "name": "Sales Trend"
+  }],
+  "layout": {"title": "Sales Over Time", "xaxis": {"title": "Date", "type": "date"}, "yaxis": {"title": "Sales"}}
+}""",
+}
+
+ECHARTS_SPECS = {
+    "bar": """{
+  "tooltip": {"trigger": "axis"},
+  "xAxis": {"type": "category", "data": df.groupby("Category")["Sales"].sum().index.tolist()},
+  "yAxis": {"type": "value"},
+  "series": [{"name": "Sales", "type": "bar", "data": df.groupby("Category")["Sales"].sum().values.tolist()}]
+}""",
+    "line": """{
+  "tooltip": {"trigger": "axis"},
+  "xAxis": {"type": "category", "data": df.sort_values("Order Date")["Order Date"].tolist()},
+  "yAxis": {"type": "value"},
+  "series": [{"name": "Sales", "type": "line", "data": df.sort_values("Order Date")["Sales"].tolist()}]
+}""",
+}
+
+
+def canned_answer(messages):
+    """
+    Pick the canned answer for a request: the library comes from the system
+    prompt, the chart kind from the last user message ("trend"/"over time" → line)
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "").lower()
+    kind = "line" if "trend" in question or "over time" in question else "bar"
+    if "Vega-Lite" in system:
+        return VEGALITE_SPEC
+    if "ECharts" in system:
+        return ECHARTS_SPECS[kind]
+    return PLOTLY_SPECS[kind]
+
+
+class StubOpenRouterHandler(BaseHTTPRequestHandler):
+    """Answers POST /chat/completions like OpenRouter, with or without "stream": true"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+    # Seconds to wait before answering, to emulate model latency
+    latency = 0.0
+    chunk_chars = 16
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = canned_answer(body.get("messages", []))
+        time.sleep(self.latency)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            for i in range(0, len(text), self.chunk_chars):
+                chunk = {"choices": [{"delta": {"content": text[i:i + self.chunk_chars]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+        else:
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": text}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+
+def start_stub_server(latency=0.0, host="127.0.0.1", port=0):
+    """
+    Start the stub in a daemon thread and return (server, base_url).
+
+    Point the app at it with OPENROUTER_BASE_URL=base_url (call_llm_api's
+    url argument takes base_url + "/chat/completions"); stop it with
+    server.shutdown().
+    """
+    handler = type("Handler", (StubOpenRouterHandler,), {"latency": latency})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/v1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stub OpenRouter server returning canned chart specs")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each answer")
+    args = parser.parse_args()
+    server, base_url = start_stub_server(args.latency, port=args.port)
+    print(f"Stub OpenRouter listening; run the app with OPENROUTER_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
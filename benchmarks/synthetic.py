@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "supermarket.csv")
+CHUNK_ROWS = 1_000_000
+
+# Columns copied together from a random template row, so City/State/Region and
+# Product ID/Category/Product Name stay consistent with each other
+TEMPLATE_COLUMNS = [
+    "Ship Mode", "Customer ID", "Customer Name", "Segment", "Country", "City", "State",
+    "Postal Code", "Region", "Product ID", "Category", "Sub-Category", "Product Name",
+]
+COLUMNS = ["Row ID", "Order ID", "Order Date", "Ship Date", *TEMPLATE_COLUMNS, "Sales"]
+FIRST_ORDER_DATE = pd.Timestamp("2015-01-03")
+ORDER_DAYS = 4 * 365
+
+
+def _template(path=TEMPLATE):
+    return pd.read_csv(path, usecols=TEMPLATE_COLUMNS, dtype=str)
+
+
+def generate_chunk(template, start, rows, rng):
+    """
+    rows synthetic orders shaped like supermarket.csv, numbered from start + 1.
+
+    Dimension columns are resampled from template rows; orders average two
+    lines, dates are dd/mm/yyyy strings over four years and Sales follow a
+    log-normal distribution close to the original's.
+    """
+    picks = rng.integers(0, len(template), rows)
+    order_dates = FIRST_ORDER_DATE + pd.to_timedelta(rng.integers(0, ORDER_DAYS, rows), unit="D")
+    ship_dates = order_dates + pd.to_timedelta(rng.integers(0, 8, rows), unit="D")
+    order_numbers = (start + np.arange(rows)) // 2 + 100_000
+
+    chunk = {
+        "Row ID": np.arange(start + 1, start + rows + 1),
+        "Order ID": pd.Series(order_dates.year.astype(str)).radd("CA-") + "-" + pd.Series(order_numbers).astype(str),
+        "Order Date": order_dates.strftime("%d/%m/%Y"),
+        "Ship Date": ship_dates.strftime("%d/%m/%Y"),
+    }
+    for col in TEMPLATE_COLUMNS:
+        chunk[col] = template[col].to_numpy()[picks]
+    chunk["Sales"] = np.round(rng.lognormal(mean=4.0, sigma=1.5, size=rows), 2)
+    return pd.DataFrame(chunk, columns=COLUMNS)
+
+
+def generate_supermarket(rows, seed=0, template_path=TEMPLATE):
+    """Synthetic supermarket DataFrame with rows rows (see generate_chunk)"""
+    rng = np.random.default_rng(seed)
+    template = _template(template_path)
+    chunks = [
+        generate_chunk(template, start, min(CHUNK_ROWS, rows - start), rng)
+        for start in range(0, rows, CHUNK_ROWS)
+    ]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def write_supermarket_csv(rows, data_dir, seed=0, template_path=TEMPLATE):
+    """
+    Write a synthetic supermarket CSV of rows rows to data_dir and return its path.
+
+    Generated in chunks so 10M rows never sit in memory at once; an existing
+    file for the same size and seed is reused.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"supermarket_{rows}_seed{seed}.csv")
+    if os.path.exists(path):
+        return path
+
+    rng = np.random.default_rng(seed)
+    template = _template(template_path)
+    partial = path + ".partial"
+    with open(partial, "w", newline="") as f:
+        for start in range(0, rows, CHUNK_ROWS):
+            chunk = generate_chunk(template, start, min(CHUNK_ROWS, rows - start), rng)
+            chunk.to_csv(f, header=start == 0, index=False)
+    os.replace(partial, path)
+    return path
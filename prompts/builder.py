@@ -0,0 +1,29 @@
+DATE_NAME_HINTS = ("date", "time", "month", "year", "day")
+
+
+def chart_tags(columns, numeric_cols, categorical_cols, date_cols=None):
+    """
+    Which optional prompt sections apply to a dataset.
+
+    "categorical" needs a categorical column, "temporal" a parsed date column
+    or a column named like one (date_cols=None keeps it, for callers that
+    don't know).
+    """
+    tags = set()
+    if categorical_cols:
+        tags.add("categorical")
+    if date_cols is None or date_cols or any(hint in str(col).lower() for col in columns for hint in DATE_NAME_HINTS):
+        tags.add("temporal")
+    return tags
+
+
+def build_prompt(static_prefix, sections, tags, dataset_block):
+    """
+    Assemble a system prompt: the static instructions first, then the
+    (tag, text) sections whose tag applies, then the dataset-specific block.
+
+    The prefix is identical for every dataset and conversation, so provider
+    side prompt caching can reuse it.
+    """
+    parts = [static_prefix, *(text for tag, text in sections if tag in tags), dataset_block]
+    return "\n\n".join(part.strip("\n") for part in parts)
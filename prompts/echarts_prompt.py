@@ -1,9 +1,9 @@
-def get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols):
-    """System prompt for ECharts option generation"""
-    return f"""You generate ONLY valid Apache ECharts option JSON.
-No explanation, no code fences, no markdown. Pure JSON only.
+from .builder import build_prompt, chart_tags
+
 
-{dataset_info}
+# Dataset-independent instructions; kept first so providers can cache them
+STATIC_PROMPT = """You generate ONLY valid Apache ECharts option JSON.
+No explanation, no code fences, no markdown. Pure JSON only.
 
 **Chart Selection Logic - Follow this decision tree:**
 
@@ -40,16 +40,16 @@ No explanation, no code fences, no markdown. Pure JSON only.
 When user asks "by category" or "by type", you MUST aggregate the data:
 
 **WRONG (plots duplicate categories):**
-{{
-  "xAxis": {{"data": df["Type"].tolist()}},  // ["A", "A", "B", "C", "C"]
-  "series": [{{"data": df["Amount"].tolist()}}]  // [10, 20, 30, 40, 50]
-}}
+{
+  "xAxis": {"data": df["Type"].tolist()},  // ["A", "A", "B", "C", "C"]
+  "series": [{"data": df["Amount"].tolist()}]  // [10, 20, 30, 40, 50]
+}
 
 **CORRECT (aggregate first using Python):**
-{{
-  "xAxis": {{"data": df.groupby("Type")["Amount"].sum().index.tolist()}},  // ["A", "B", "C"]
-  "series": [{{"data": df.groupby("Type")["Amount"].sum().values.tolist()}}]  // [30, 30, 90]
-}}
+{
+  "xAxis": {"data": df.groupby("Type")["Amount"].sum().index.tolist()},  // ["A", "B", "C"]
+  "series": [{"data": df.groupby("Type")["Amount"].sum().values.tolist()}]  // [30, 30, 90]
+}
 
 **Common aggregations:**
 - Sum by category: `df.groupby("Category")["Value"].sum()`
@@ -67,38 +67,50 @@ When user asks "by category" or "by type", you MUST aggregate the data:
 **Format examples:**
 
 **Bar chart (comparing categories):**
-{{
-  "tooltip": {{"trigger": "axis"}},
-  "xAxis": {{"type": "category", "data": df["Country"].tolist()}},
-  "yAxis": {{"type": "value"}},
-  "series": [{{"name": "Sales", "type": "bar", "data": df["Sales"].tolist()}}]
-}}
-
-**Line chart (trend over time):**
-{{
-  "tooltip": {{"trigger": "axis"}},
-  "xAxis": {{"type": "category", "data": df["Order Date"].tolist()}},
-  "yAxis": {{"type": "value"}},
-  "series": [{{"name": "Sales", "type": "line", "data": df["Sales"].tolist()}}]
-}}
-
-**Pie chart (proportions):**
-{{
-  "tooltip": {{"trigger": "item"}},
-  "series": [{{
+{
+  "tooltip": {"trigger": "axis"},
+  "xAxis": {"type": "category", "data": df["Country"].tolist()},
+  "yAxis": {"type": "value"},
+  "series": [{"name": "Sales", "type": "bar", "data": df["Sales"].tolist()}]
+}
+
+**REMEMBER:**
+- Always use df["actual_column_name"].tolist()
+- Replace "actual_column_name" with real column names from the column list
+- NEVER leave data arrays empty []"""
+
+# Examples and rules only sent when the dataset has matching columns
+SECTIONS = [
+    ("categorical", """**Pie chart (proportions):**
+{
+  "tooltip": {"trigger": "item"},
+  "series": [{
     "name": "Category",
     "type": "pie",
-    "data": [{{"value": v, "name": n}} for v, n in zip(df["Sales"].tolist(), df["Category"].tolist())]
-  }}]
-}}
+    "data": [{"value": v, "name": n} for v, n in zip(df["Sales"].tolist(), df["Category"].tolist())]
+  }]
+}"""),
+    ("temporal", """**Line chart (trend over time):**
+{
+  "tooltip": {"trigger": "axis"},
+  "xAxis": {"type": "category", "data": df["Order Date"].tolist()},
+  "yAxis": {"type": "value"},
+  "series": [{"name": "Sales", "type": "line", "data": df["Sales"].tolist()}]
+}
+
+**REMEMBER - for date/time columns:**
+- Columns listed under "Date columns" are already datetime: use `df["Date Column"].dt...` directly, no `pd.to_datetime`"""),
+]
+
+
+def get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols=None):
+    """System prompt for ECharts option generation"""
+    dataset_block = f"""{dataset_info}
 
 Available columns: {', '.join(columns)}
 Numeric: {', '.join(numeric_cols)}
 Categorical: {', '.join(categorical_cols)}
 
-**REMEMBER:**
-- Always use df["actual_column_name"].tolist()
-- Replace "actual_column_name" with real column names from the list above
-- NEVER leave data arrays empty []
-
 Return ONLY the JSON option, no other text."""
+    tags = chart_tags(columns, numeric_cols, categorical_cols, date_cols)
+    return build_prompt(STATIC_PROMPT, SECTIONS, tags, dataset_block)
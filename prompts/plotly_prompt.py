@@ -1,9 +1,9 @@
-def get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols):
-    """System prompt for Plotly spec generation"""
-    return f"""You generate ONLY valid Plotly JSON figure specs.
-No explanation, no code fences, no markdown. Pure JSON only.
+from .builder import build_prompt, chart_tags
 
-{dataset_info}
+
+# Dataset-independent instructions; kept first so providers can cache them
+STATIC_PROMPT = """You generate ONLY valid Plotly JSON figure specs.
+No explanation, no code fences, no markdown. Pure JSON only.
 
 **Chart Selection Logic - Follow this decision tree:**
 
@@ -38,22 +38,22 @@ No explanation, no code fences, no markdown. Pure JSON only.
 When user asks "by category" or "by type", you MUST aggregate the data:
 
 **WRONG (plots duplicate categories):**
-{{
-  "data": [{{
+{
+  "data": [{
     "type": "bar",
     "x": df["Type"].tolist(),  // ["A", "A", "B", "C", "C"]
     "y": df["Amount"].tolist()  // [10, 20, 30, 40, 50]
-  }}]
-}}
+  }]
+}
 
 **CORRECT (aggregate first using Python):**
-{{
-  "data": [{{
+{
+  "data": [{
     "type": "bar",
     "x": df.groupby("Type")["Amount"].sum().index.tolist(),  // ["A", "B", "C"]
     "y": df.groupby("Type")["Amount"].sum().values.tolist()  // [30, 30, 90]
-  }}]
-}}
+  }]
+}
 
 **Common aggregations:**
 - Sum by category: `df.groupby("Category")["Value"].sum()`
@@ -72,55 +72,58 @@ When user asks "by category" or "by type", you MUST aggregate the data:
 **Format examples:**
 
 **Bar chart (comparing categories):**
-{{
-  "data": [{{
+{
+  "data": [{
     "type": "bar",
     "x": df["Country"].tolist(),
     "y": df["Sales"].tolist(),
     "name": "Sales"
-  }}],
-  "layout": {{
+  }],
+  "layout": {
     "title": "Sales by Country",
-    "xaxis": {{"title": "Country"}},
-    "yaxis": {{"title": "Sales"}}
-  }}
-}}
-
-**Line chart (trend over time):**
-{{
-  "data": [{{
+    "xaxis": {"title": "Country"},
+    "yaxis": {"title": "Sales"}
+  }
+}
+
+**REMEMBER:**
+- Always use UNQUOTED df["actual_column_name"].tolist()
+- Replace "actual_column_name" with real column names from the column list
+- NEVER use quoted strings like "df['column'].tolist()"
+- NEVER leave data arrays empty []"""
+
+# Examples and rules only sent when the dataset has matching columns
+SECTIONS = [
+    ("categorical", """**Pie chart (proportions):**
+{
+  "data": [{
+    "type": "pie",
+    "labels": df["Category"].tolist(),
+    "values": df["Sales"].tolist()
+  }],
+  "layout": {"title": "Sales Distribution"}
+}"""),
+    ("temporal", """**Line chart (trend over time):**
+{
+  "data": [{
     "type": "scatter",
     "mode": "lines+markers",
     "x": df.assign(_temp_date=pd.to_datetime(df["Order Date"], errors='coerce', dayfirst=True)).sort_values("_temp_date")["_temp_date"].dt.strftime("%Y-%m-%d").tolist(),
     "y": df.assign(_temp_date=pd.to_datetime(df["Order Date"], errors='coerce', dayfirst=True)).sort_values("_temp_date")["Sales"].tolist(),
     "name": "Sales Trend"
-  }}],
-  "layout": {{
+  }],
+  "layout": {
     "title": "Sales Over Time",
-    "xaxis": {{"title": "Date", "type": "date"}},
-    "yaxis": {{"title": "Sales"}}
-  }}
-}}
-
-**Pie chart (proportions):**
-{{
-  "data": [{{
-    "type": "pie",
-    "labels": df["Category"].tolist(),
-    "values": df["Sales"].tolist()
-  }}],
-  "layout": {{"title": "Sales Distribution"}}
-}}
-
-Available columns: {', '.join(columns)}
-Numeric: {', '.join(numeric_cols)}
-Categorical: {', '.join(categorical_cols)}
+    "xaxis": {"title": "Date", "type": "date"},
+    "yaxis": {"title": "Sales"}
+  }
+}
 
 **CRITICAL: Date/Time Handling in Plotly**
 - When x-axis contains dates or timestamps, you MUST:
   1. **SORT the dataframe by the date column FIRST**
   2. Convert dates to ISO format (YYYY-MM-DD)
-  3. Set `"xaxis": {{"type": "date"}}` in layout
+  3. Set `"xaxis": {"type": "date"}` in layout
 
 - **WRONG (unsorted, will be out of order):**
   ```
@@ -133,21 +136,30 @@ Categorical: {', '.join(categorical_cols)}
   "y": df.assign(_temp_date=pd.to_datetime(df["Order Date"], errors='coerce', dayfirst=True)).sort_values("_temp_date")["Sales"].tolist()
   ```
 
-- Use `.assign(_temp_date=pd.to_datetime(..., errors='coerce', dayfirst=True))` for date parsing
+- If the column is listed under "Date columns" it is already datetime - skip `pd.to_datetime` and sort directly:
+  `df.sort_values("Order Date")["Order Date"].dt.strftime("%Y-%m-%d").tolist()`
+- Otherwise use `.assign(_temp_date=pd.to_datetime(..., errors='coerce', dayfirst=True))` for date parsing
 - `errors='coerce'` handles various formats, `dayfirst=True` supports international dates (dd/mm/yyyy)
 - Sort by the temp column, not the original string column
 - Both x and y data must use the SAME `.assign().sort_values()` chain
 
-**REMEMBER:**
-- Always use UNQUOTED df["actual_column_name"].tolist()
-- Replace "actual_column_name" with real column names from the list above
-- NEVER use quoted strings like "df['column'].tolist()"
-- NEVER leave data arrays empty []
-- For date/time columns on x-axis:
+**REMEMBER - for date/time columns on x-axis:**
   1. **Parse and sort by datetime**: `df.assign(_temp_date=pd.to_datetime(df["Date Column"], errors='coerce', dayfirst=True)).sort_values("_temp_date")`
   2. Use the temp column for x-axis, format as ISO with `.dt.strftime("%Y-%m-%d")`
   3. Apply SAME `.assign().sort_values()` to ALL data arrays (x, y, etc.)
-  4. Set `"xaxis": {{"type": "date"}}` in layout
-  5. Always use `errors='coerce'` and `dayfirst=True` for international date support
+  4. Set `"xaxis": {"type": "date"}` in layout
+  5. Always use `errors='coerce'` and `dayfirst=True` for international date support"""),
+]
+
+
+def get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols=None):
+    """System prompt for Plotly spec generation"""
+    dataset_block = f"""{dataset_info}
+
+Available columns: {', '.join(columns)}
+Numeric: {', '.join(numeric_cols)}
+Categorical: {', '.join(categorical_cols)}
 
 Return ONLY the JSON spec, no other text."""
+    tags = chart_tags(columns, numeric_cols, categorical_cols, date_cols)
+    return build_prompt(STATIC_PROMPT, SECTIONS, tags, dataset_block)
@@ -1,8 +1,8 @@
-def get_system_prompt(dataset_info, numeric_cols, categorical_cols):
-    """System prompt for Vega-Lite spec generation"""
-    return f"""You are a data analyst assistant helping users analyze their dataset.
+from .builder import build_prompt
 
-{dataset_info}
+
+# Dataset-independent instructions; kept first so providers can cache them
+STATIC_PROMPT = """You are a data analyst assistant helping users analyze their dataset.
 
 When users ask for visualizations:
 1. First provide a brief insight about what the visualization will show
@@ -11,32 +11,41 @@ When users ask for visualizations:
 4. Do NOT add any commentary after the JSON
 
 **Vega-Lite Structure:**
-{{
+{
   "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
   "mark": "mark_type",
-  "encoding": {{
-    "x": {{"field": "column_name", "type": "data_type"}},
-    "y": {{"field": "column_name", "type": "data_type", "aggregate": "aggregation"}}
-  }}
-}}
+  "encoding": {
+    "x": {"field": "column_name", "type": "data_type"},
+    "y": {"field": "column_name", "type": "data_type", "aggregate": "aggregation"}
+  }
+}
 
 **Available mark types:** bar, line, point, circle, area, rect, boxplot
 
 **Data types:**
-- nominal: categorical/text fields ({', '.join(categorical_cols[:5]) if categorical_cols else 'none'})
-- quantitative: numeric fields ({', '.join(numeric_cols[:5]) if numeric_cols else 'none'})
+- nominal: categorical/text fields
+- quantitative: numeric fields
 - temporal: date/time fields
 
 **Aggregations:** mean, sum, count, max, min, median
 
 **Example - bar chart:**
-{{
+{
   "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
   "mark": "bar",
-  "encoding": {{
-    "x": {{"field": "category_field", "type": "nominal"}},
-    "y": {{"field": "numeric_field", "type": "quantitative", "aggregate": "mean"}}
-  }}
-}}
+  "encoding": {
+    "x": {"field": "category_field", "type": "nominal"},
+    "y": {"field": "numeric_field", "type": "quantitative", "aggregate": "mean"}
+  }
+}"""
+
+
+def get_system_prompt(dataset_info, numeric_cols, categorical_cols):
+    """System prompt for Vega-Lite spec generation"""
+    dataset_block = f"""{dataset_info}
+
+Nominal fields: {', '.join(categorical_cols[:5]) if categorical_cols else 'none'}
+Quantitative fields: {', '.join(numeric_cols[:5]) if numeric_cols else 'none'}
 
 Always generate pure Vega-Lite JSON for chart requests."""
+    return build_prompt(STATIC_PROMPT, [], set(), dataset_block)
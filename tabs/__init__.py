@@ -1,9 +1,11 @@
 from .pygwalker_tab import render_pygwalker_tab
 from .plotly_tab import render_plotly_tab
 from .echarts_tab import render_echarts_tab
+from .broadcast import render_broadcast_input
 
 __all__ = [
     'render_pygwalker_tab',
     'render_plotly_tab',
     'render_echarts_tab',
+    'render_broadcast_input',
 ]
@@ -0,0 +1,42 @@
+import streamlit as st
+from utils import job_pending
+from .pygwalker_tab import ask_pygwalker
+from .plotly_tab import ask_plotly
+from .echarts_tab import ask_echarts
+
+
+def render_broadcast_input(df, api_key_input, model_choice):
+    """Render the input that sends one question to the PygWalker, Plotly and ECharts chats at once"""
+    with st.form(key="chat_form_broadcast", clear_on_submit=True):
+        col1, col2 = st.columns([6, 1])
+        with col1:
+            prompt_broadcast = st.text_input("", placeholder="Ask all three charts at once...", label_visibility="collapsed", key="broadcast_input")
+        with col2:
+            # Each chat takes one question at a time, so wait until none of them is answering
+            busy = any(job_pending(key) for key in ("pending_pygwalker", "pending_plotly", "pending_echarts"))
+            submit_broadcast = st.form_submit_button("Send to all", use_container_width=True, disabled=busy)
+
+    jobs = [job for job in st.session_state.get("broadcast_jobs", []) if job.finished_at is not None]
+    if jobs and all(job.done() for job in st.session_state.broadcast_jobs):
+        durations = [job.finished_at - job.started_at for job in jobs]
+        wall = max(job.finished_at for job in jobs) - min(job.submitted_at for job in jobs)
+        st.caption(
+            f"📣 Answered in {len(jobs)} tab(s) in {wall:.1f}s "
+            f"(slowest request {max(durations):.1f}s, {sum(durations):.1f}s one after another)"
+        )
+
+    if submit_broadcast and prompt_broadcast:
+        if not api_key_input:
+            st.error("Please enter your OpenRouter API key in the sidebar")
+        else:
+            try:
+                # The requests run concurrently on the shared LLM pool, so the
+                # wait is close to the slowest single request
+                st.session_state.broadcast_jobs = [
+                    ask(df, api_key_input, model_choice, prompt_broadcast)
+                    for ask in (ask_pygwalker, ask_plotly, ask_echarts)
+                ]
+                st.rerun()
+
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
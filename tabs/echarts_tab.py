@@ -1,23 +1,96 @@
 import streamlit as st
 from utils import (
-    call_llm_api,
+    count_message_tokens,
+    fit_to_budget,
+    finished_job,
+    job_pending,
+    ready_spec,
+    render_pending,
+    start_job,
+    submit_completion,
+    tracer,
+    response_cache,
     extract_json_spec,
-    get_dataset_info,
-    get_echarts_prompt,
+    get_dataset_profile,
     render_echarts_chart
 )
 
 
+def _take_reply():
+    """Move a finished reply into the ECharts chat history"""
+    job = finished_job("pending_echarts")
+    if job is not None:
+        with tracer.span("apply_reply", trace_id=st.session_state.get("trace_echarts"), tab="echarts"):
+            try:
+                assistant_message = job.result()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+            else:
+                st.session_state.messages_echarts.append({"role": "assistant", "content": assistant_message})
+                st.session_state.current_echarts_spec = extract_json_spec(assistant_message)
+
+
+def ask_echarts(df, api_key_input, model_choice, question):
+    """Add question to the ECharts chat and start its completion on the shared LLM pool"""
+    if job_pending("pending_echarts"):
+        raise RuntimeError("Wait for the previous reply to finish")
+    # A reply that finished but wasn't shown yet goes into the history before the new question
+    _take_reply()
+
+    # Submitted inside the root span so the LLM call on the pool is traced as its child
+    with tracer.span("chat_request", tab="echarts") as root:
+        st.session_state.messages_echarts.append({"role": "user", "content": question})
+
+        with tracer.span("build_prompt", library="echarts") as span:
+            profile = get_dataset_profile(df)
+            system_prompt = profile.system_prompt("echarts")
+
+            # Earlier specs are summarized so each request stays within the token budget
+            messages = fit_to_budget(
+                system_prompt,
+                st.session_state.messages_echarts,
+                keep_turns=st.session_state.get("history_turns")
+            )
+            st.session_state.prompt_tokens_echarts = {
+                **profile.prompt_tokens("echarts"),
+                "request": count_message_tokens(messages)
+            }
+            span.set(prompt_tokens=st.session_state.prompt_tokens_echarts["request"])
+
+        # Runs on the shared LLM pool; the reply is shown as it streams in
+        # and picked up by finished_job on a later run
+        job = submit_completion(
+            api_key_input,
+            model_choice,
+            messages,
+            stream=st.session_state.get("stream_responses", True),
+            cache=response_cache if st.session_state.get("cache_responses", True) else None,
+            fuzzy=st.session_state.get("fuzzy_cache", False)
+        )
+        start_job("pending_echarts", job)
+        st.session_state.trace_echarts = root.trace_id
+    return job
+
+
 def render_echarts_tab(df, api_key_input, model_choice):
     """Render ECharts tab with chat interface"""
     st.subheader("💬 Chat with Your Data")
 
+    # Pick up a reply that finished in the background since the last run
+    _take_reply()
+
+    # Render the chart as soon as its spec has streamed in; the finished reply replaces it
+    spec_text = ready_spec("pending_echarts")
+    if spec_text is not None:
+        st.session_state.current_echarts_spec = extract_json_spec(spec_text)
+
     # Display chat messages
     chat_container_echarts = st.container(height=300)
     with chat_container_echarts:
         for message in st.session_state.messages_echarts:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        render_pending("pending_echarts")
 
     # Chat input
     with st.form(key="chat_form_echarts", clear_on_submit=True):
@@ -25,29 +98,21 @@ def render_echarts_tab(df, api_key_input, model_choice):
         with col1:
             prompt_echarts = st.text_input("", placeholder="Ask for an ECharts visualization...", label_visibility="collapsed", key="echarts_input")
         with col2:
-            submit_echarts = st.form_submit_button("Send", use_container_width=True)
+            submit_echarts = st.form_submit_button("Send", use_container_width=True, disabled=job_pending("pending_echarts"))
+
+    prompt_tokens = st.session_state.get("prompt_tokens_echarts")
+    if prompt_tokens:
+        st.caption(
+            f"🧮 Last request: ~{prompt_tokens['request']:,} prompt tokens "
+            f"(system {prompt_tokens['system']:,}, cacheable prefix {prompt_tokens['static_prefix']:,})"
+        )
 
     if submit_echarts and prompt_echarts:
         if not api_key_input:
             st.error("Please enter your OpenRouter API key in the sidebar")
         else:
-            st.session_state.messages_echarts.append({"role": "user", "content": prompt_echarts})
-
-            dataset_info, numeric_cols, categorical_cols = get_dataset_info(df)
-
             try:
-                system_prompt = get_echarts_prompt(dataset_info, df.columns.tolist(), numeric_cols, categorical_cols)
-
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    *st.session_state.messages_echarts
-                ]
-
-                assistant_message = call_llm_api(api_key_input, model_choice, messages)
-                st.session_state.messages_echarts.append({"role": "assistant", "content": assistant_message})
-
-                spec_text = extract_json_spec(assistant_message)
-                st.session_state.current_echarts_spec = spec_text
+                ask_echarts(df, api_key_input, model_choice, prompt_echarts)
                 st.rerun()
 
             except Exception as e:
@@ -66,7 +131,8 @@ def render_echarts_tab(df, api_key_input, model_choice):
             st.rerun()
 
         try:
-            render_echarts_chart(st.session_state.current_echarts_spec, df)
+            with tracer.span("render_chart", trace_id=st.session_state.get("trace_echarts"), tab="echarts"):
+                render_echarts_chart(st.session_state.current_echarts_spec, df)
         except Exception as e:
             st.error(f"Error rendering chart: {e}")
             st.info("Try rephrasing your request or ask to fix the error.")
@@ -1,23 +1,96 @@
 import streamlit as st
 from utils import (
-    call_llm_api,
+    count_message_tokens,
+    fit_to_budget,
+    finished_job,
+    job_pending,
+    ready_spec,
+    render_pending,
+    start_job,
+    submit_completion,
+    tracer,
+    response_cache,
     extract_json_spec,
-    get_dataset_info,
-    get_plotly_prompt,
+    get_dataset_profile,
     render_plotly_chart
 )
 
 
+def _take_reply():
+    """Move a finished reply into the Plotly chat history"""
+    job = finished_job("pending_plotly")
+    if job is not None:
+        with tracer.span("apply_reply", trace_id=st.session_state.get("trace_plotly"), tab="plotly"):
+            try:
+                assistant_message = job.result()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+            else:
+                st.session_state.messages_plotly.append({"role": "assistant", "content": assistant_message})
+                st.session_state.current_plotly_spec = extract_json_spec(assistant_message)
+
+
+def ask_plotly(df, api_key_input, model_choice, question):
+    """Add question to the Plotly chat and start its completion on the shared LLM pool"""
+    if job_pending("pending_plotly"):
+        raise RuntimeError("Wait for the previous reply to finish")
+    # A reply that finished but wasn't shown yet goes into the history before the new question
+    _take_reply()
+
+    # Submitted inside the root span so the LLM call on the pool is traced as its child
+    with tracer.span("chat_request", tab="plotly") as root:
+        st.session_state.messages_plotly.append({"role": "user", "content": question})
+
+        with tracer.span("build_prompt", library="plotly") as span:
+            profile = get_dataset_profile(df)
+            system_prompt = profile.system_prompt("plotly")
+
+            # Earlier specs are summarized so each request stays within the token budget
+            messages = fit_to_budget(
+                system_prompt,
+                st.session_state.messages_plotly,
+                keep_turns=st.session_state.get("history_turns")
+            )
+            st.session_state.prompt_tokens_plotly = {
+                **profile.prompt_tokens("plotly"),
+                "request": count_message_tokens(messages)
+            }
+            span.set(prompt_tokens=st.session_state.prompt_tokens_plotly["request"])
+
+        # Runs on the shared LLM pool; the reply is shown as it streams in
+        # and picked up by finished_job on a later run
+        job = submit_completion(
+            api_key_input,
+            model_choice,
+            messages,
+            stream=st.session_state.get("stream_responses", True),
+            cache=response_cache if st.session_state.get("cache_responses", True) else None,
+            fuzzy=st.session_state.get("fuzzy_cache", False)
+        )
+        start_job("pending_plotly", job)
+        st.session_state.trace_plotly = root.trace_id
+    return job
+
+
 def render_plotly_tab(df, api_key_input, model_choice):
     """Render Plotly tab with chat interface"""
     st.subheader("💬 Chat with Your Data")
 
+    # Pick up a reply that finished in the background since the last run
+    _take_reply()
+
+    # Render the chart as soon as its spec has streamed in; the finished reply replaces it
+    spec_text = ready_spec("pending_plotly")
+    if spec_text is not None:
+        st.session_state.current_plotly_spec = extract_json_spec(spec_text)
+
     # Display chat messages
     chat_container_plotly = st.container(height=300)
     with chat_container_plotly:
         for message in st.session_state.messages_plotly:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        render_pending("pending_plotly")
 
     # Chat input
     with st.form(key="chat_form_plotly", clear_on_submit=True):
@@ -25,29 +98,21 @@ def render_plotly_tab(df, api_key_input, model_choice):
         with col1:
             prompt_plotly = st.text_input("", placeholder="Ask for a Plotly visualization...", label_visibility="collapsed", key="plotly_input")
         with col2:
-            submit_plotly = st.form_submit_button("Send", use_container_width=True)
+            submit_plotly = st.form_submit_button("Send", use_container_width=True, disabled=job_pending("pending_plotly"))
+
+    prompt_tokens = st.session_state.get("prompt_tokens_plotly")
+    if prompt_tokens:
+        st.caption(
+            f"🧮 Last request: ~{prompt_tokens['request']:,} prompt tokens "
+            f"(system {prompt_tokens['system']:,}, cacheable prefix {prompt_tokens['static_prefix']:,})"
+        )
 
     if submit_plotly and prompt_plotly:
         if not api_key_input:
             st.error("Please enter your OpenRouter API key in the sidebar")
         else:
-            st.session_state.messages_plotly.append({"role": "user", "content": prompt_plotly})
-
-            dataset_info, numeric_cols, categorical_cols = get_dataset_info(df)
-
             try:
-                system_prompt = get_plotly_prompt(dataset_info, df.columns.tolist(), numeric_cols, categorical_cols)
-
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    *st.session_state.messages_plotly
-                ]
-
-                assistant_message = call_llm_api(api_key_input, model_choice, messages)
-                st.session_state.messages_plotly.append({"role": "assistant", "content": assistant_message})
-
-                spec_text = extract_json_spec(assistant_message)
-                st.session_state.current_plotly_spec = spec_text
+                ask_plotly(df, api_key_input, model_choice, prompt_plotly)
                 st.rerun()
 
             except Exception as e:
@@ -66,7 +131,8 @@ def render_plotly_tab(df, api_key_input, model_choice):
             st.rerun()
 
         try:
-            render_plotly_chart(st.session_state.current_plotly_spec, df)
+            with tracer.span("render_chart", trace_id=st.session_state.get("trace_plotly"), tab="plotly"):
+                render_plotly_chart(st.session_state.current_plotly_spec, df)
         except Exception as e:
             st.error(f"Error rendering chart: {e}")
             st.info("Try rephrasing your request or ask to fix the error.")
@@ -1,25 +1,150 @@
+import hashlib
+import json
+from contextlib import nullcontext
 import streamlit as st
 import pygwalker as pyg
 from pygwalker.api.streamlit import StreamlitRenderer
 import streamlit.components.v1 as components
 from utils import (
-    call_llm_api,
+    count_message_tokens,
+    fit_to_budget,
+    finished_job,
+    job_pending,
+    ready_spec,
+    render_pending,
+    start_job,
+    submit_completion,
+    tracer,
+    response_cache,
+    dataset_fingerprint,
     extract_vegalite_spec,
-    get_dataset_info,
-    get_vegalite_prompt
+    get_dataset_profile
 )
 
 
+# Above this many rows PygWalker is always asked to compute aggregations in the
+# Python kernel (DuckDB over the DataFrame), so only query results are sent to
+# the browser; smaller datasets get the library default (kernel in 0.5.x)
+KERNEL_COMPUTATION_ROWS = 100_000
+# The static HTML fallback embeds its data in the page, so it gets a sample
+HTML_FALLBACK_ROWS = 5_000
+# Renderers kept alive across reruns and sessions, least recently used evicted first
+RENDERER_CACHE_SIZE = 8
+
+
+@st.cache_resource(max_entries=RENDERER_CACHE_SIZE, show_spinner=False)
+def _get_renderer(fingerprint, spec_json, kernel_computation, _df):
+    """
+    One StreamlitRenderer per (dataset fingerprint, spec).
+
+    PygWalker infers field metadata and serializes the data when a renderer
+    is created; caching the instance means reruns, tab switches and sidebar
+    changes reuse it. The gid (and so the component key) follows the spec,
+    so a new spec still replaces the chart.
+    """
+    gid = hashlib.sha1(f"{fingerprint}:{spec_json}".encode()).hexdigest()[:16]
+    options = {"kernel_computation": True} if kernel_computation else {}
+    return StreamlitRenderer(
+        _df,
+        gid=gid,
+        spec=json.loads(spec_json) if spec_json else "",
+        **options
+    )
+
+
+def _html_sample(df):
+    """At most HTML_FALLBACK_ROWS rows, in their original order"""
+    if len(df) <= HTML_FALLBACK_ROWS:
+        return df
+    return df.sample(HTML_FALLBACK_ROWS, random_state=0).sort_index()
+
+
+def _take_reply():
+    """Move a finished reply into the PygWalker chat history"""
+    job = finished_job("pending_pygwalker")
+    if job is not None:
+        with tracer.span("apply_reply", trace_id=st.session_state.get("trace_pygwalker"), tab="pygwalker"):
+            try:
+                assistant_message = job.result()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+            else:
+                st.session_state.messages.append({"role": "assistant", "content": assistant_message})
+
+                # Try to extract Vega-Lite spec (unless it was already shown while streaming)
+                spec_data = extract_vegalite_spec(assistant_message)
+                if spec_data and spec_data != st.session_state.current_spec:
+                    st.session_state.current_spec = spec_data
+                    st.session_state.spec_version += 1
+
+
+def ask_pygwalker(df, api_key_input, model_choice, question):
+    """Add question to the PygWalker chat and start its completion on the shared LLM pool"""
+    if job_pending("pending_pygwalker"):
+        raise RuntimeError("Wait for the previous reply to finish")
+    # A reply that finished but wasn't shown yet goes into the history before the new question
+    _take_reply()
+
+    # Submitted inside the root span so the LLM call on the pool is traced as its child
+    with tracer.span("chat_request", tab="pygwalker") as root:
+        st.session_state.messages.append({"role": "user", "content": question})
+
+        with tracer.span("build_prompt", library="vegalite") as span:
+            profile = get_dataset_profile(df)
+            system_prompt = profile.system_prompt("vegalite")
+
+            # Earlier specs are summarized so each request stays within the token budget
+            messages = fit_to_budget(
+                system_prompt,
+                st.session_state.messages,
+                keep_turns=st.session_state.get("history_turns")
+            )
+            st.session_state.prompt_tokens_pygwalker = {
+                **profile.prompt_tokens("vegalite"),
+                "request": count_message_tokens(messages)
+            }
+            span.set(prompt_tokens=st.session_state.prompt_tokens_pygwalker["request"])
+
+        # Runs on the shared LLM pool; the reply is shown as it streams in
+        # and picked up by finished_job on a later run
+        job = submit_completion(
+            api_key_input,
+            model_choice,
+            messages,
+            stream=st.session_state.get("stream_responses", True),
+            cache=response_cache if st.session_state.get("cache_responses", True) else None,
+            fuzzy=st.session_state.get("fuzzy_cache", False)
+        )
+        start_job("pending_pygwalker", job)
+        st.session_state.trace_pygwalker = root.trace_id
+    return job
+
+
 def render_pygwalker_tab(df, api_key_input, model_choice):
     """Render PygWalker tab with chat interface"""
     st.subheader("💬 Chat with Your Data")
 
+    # Pick up a reply that finished in the background since the last run
+    _take_reply()
+
+    # Render the chart as soon as its spec has streamed in; the finished reply replaces it
+    spec_text = ready_spec("pending_pygwalker")
+    if spec_text is not None:
+        try:
+            spec_data = extract_vegalite_spec(spec_text)
+        except ValueError:
+            spec_data = None
+        if spec_data:
+            st.session_state.current_spec = spec_data
+            st.session_state.spec_version += 1
+
     # Display chat messages
     chat_container = st.container(height=300)
     with chat_container:
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        render_pending("pending_pygwalker")
 
     # Chat input
     with st.form(key="chat_form", clear_on_submit=True):
@@ -27,33 +152,21 @@ def render_pygwalker_tab(df, api_key_input, model_choice):
         with col1:
             prompt = st.text_input("", placeholder="Ask me about the data or request a visualization...", label_visibility="collapsed")
         with col2:
-            submit = st.form_submit_button("Send", use_container_width=True)
+            submit = st.form_submit_button("Send", use_container_width=True, disabled=job_pending("pending_pygwalker"))
+
+    prompt_tokens = st.session_state.get("prompt_tokens_pygwalker")
+    if prompt_tokens:
+        st.caption(
+            f"🧮 Last request: ~{prompt_tokens['request']:,} prompt tokens "
+            f"(system {prompt_tokens['system']:,}, cacheable prefix {prompt_tokens['static_prefix']:,})"
+        )
 
     if submit and prompt:
         if not api_key_input:
             st.error("Please enter your OpenRouter API key in the sidebar")
         else:
-            st.session_state.messages.append({"role": "user", "content": prompt})
-
-            dataset_info, numeric_cols, categorical_cols = get_dataset_info(df)
-
             try:
-                system_prompt = get_vegalite_prompt(dataset_info, numeric_cols, categorical_cols)
-
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    *st.session_state.messages
-                ]
-
-                assistant_message = call_llm_api(api_key_input, model_choice, messages)
-                st.session_state.messages.append({"role": "assistant", "content": assistant_message})
-
-                # Try to extract Vega-Lite spec
-                spec_data = extract_vegalite_spec(assistant_message)
-                if spec_data:
-                    st.session_state.current_spec = spec_data
-                    st.session_state.spec_version += 1
-
+                ask_pygwalker(df, api_key_input, model_choice, prompt)
                 st.rerun()
 
             except Exception as e:
@@ -74,24 +187,31 @@ def render_pygwalker_tab(df, api_key_input, model_choice):
             st.session_state.spec_version += 1
             st.rerun()
 
+    # Large datasets must stay in the kernel; the browser only receives aggregated query results
+    kernel_computation = len(df) > KERNEL_COMPUTATION_ROWS
+    if kernel_computation:
+        st.caption(f"⚙️ {len(df):,} rows: aggregations are computed server-side (DuckDB) for PygWalker")
+
     # Render with PygWalker
     try:
         if st.session_state.current_spec:
-            renderer = StreamlitRenderer(
-                df,
-                spec=st.session_state.current_spec,
-                key=f"pygwalker_{st.session_state.spec_version}"
-            )
-            renderer.explorer()
+            spec_json = json.dumps(st.session_state.current_spec, sort_keys=True)
         else:
             st.info("💡 Ask me to create a visualization in the chat above, or drag fields manually below.")
-            renderer = StreamlitRenderer(
-                df,
-                key=f"pygwalker_default_{st.session_state.spec_version}"
-            )
+            spec_json = ""
+        # Only AI charts are traced; the plain explorer would add a trace on every rerun
+        render_span = (
+            tracer.span("render_chart", trace_id=st.session_state.get("trace_pygwalker"), tab="pygwalker", rows=len(df))
+            if spec_json else nullcontext()
+        )
+        with render_span:
+            renderer = _get_renderer(dataset_fingerprint(df), spec_json, kernel_computation, df)
             renderer.explorer()
     except Exception as e:
         st.error(f"Error rendering chart: {e}")
         st.write("Falling back to default interface...")
-        pyg_html = pyg.to_html(df)
+        sample = _html_sample(df)
+        if len(sample) < len(df):
+            st.caption(f"Showing a random sample of {len(sample):,} of {len(df):,} rows")
+        pyg_html = pyg.to_html(sample)
         components.html(pyg_html, height=700, scrolling=True)
@@ -0,0 +1,45 @@
+import email.utils
+import io
+import time
+
+import pytest
+import requests
+
+from utils import chat_handler
+from utils.chat_handler import BACKOFF_MAX, _retry_delay, post_with_retries
+
+
+def _response(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(b"")
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+@pytest.mark.parametrize("header", ["garbage", "Mon, 99 Foo 2024", "nan", ""])
+def test_malformed_retry_after_falls_back_to_backoff(header):
+    delay = _retry_delay(2, _response(429, header))
+    assert 0.0 <= delay <= chat_handler.BACKOFF_BASE * 2 ** 2
+
+
+def test_retry_after_seconds_and_date():
+    assert _retry_delay(0, _response(503, "7")) == 7.0
+    assert _retry_delay(0, _response(503, "3600")) == BACKOFF_MAX
+    date = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 5.0 < _retry_delay(0, _response(503, date)) <= 10.0
+
+
+def test_post_with_retries_survives_garbage_header(monkeypatch):
+    replies = [_response(429, "garbage"), _response(200)]
+
+    class Session:
+        def post(self, *args, **kwargs):
+            return replies.pop(0)
+
+    monkeypatch.setattr(chat_handler, "get_session", lambda: Session())
+    monkeypatch.setattr(chat_handler.time, "sleep", lambda seconds: None)
+    response, attempts = post_with_retries("http://example.invalid", {}, {})
+    assert response.status_code == 200
+    assert attempts == 2
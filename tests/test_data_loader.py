@@ -0,0 +1,51 @@
+import io
+
+import pandas as pd
+
+from utils.data_loader import load_csv, stream_csv
+from utils.expression_engine import compile_expression
+
+
+def _csv(rows=9800):
+    frame = pd.DataFrame({
+        "Row ID": range(1, rows + 1),
+        "Region": ["East", "West"] * (rows // 2),
+        "Sales": [1.5] * rows,
+    })
+    return io.BytesIO(frame.to_csv(index=False).encode())
+
+
+def test_integers_keep_int64_by_default():
+    df, report = load_csv(_csv())
+    assert report.downcast_columns == {}
+    assert compile_expression('df["Row ID"].mul(10).tolist()').evaluate(df)[-3:] == [97980, 97990, 98000]
+
+
+def test_arithmetic_on_downcast_column():
+    df, report = load_csv(_csv(), downcast=True)
+    assert report.downcast_columns["Row ID"] == "int16"
+    # The narrow dtype is what makes opt-in necessary: pandas keeps int16 and wraps
+    assert compile_expression('df["Row ID"].mul(10).tolist()').evaluate(df)[-1] != 98000
+    assert compile_expression('df["Row ID"].astype(int).mul(10).tolist()').evaluate(df)[-1] == 98000
+
+
+def test_stream_csv_keeps_int64_by_default():
+    df, report = stream_csv(_csv(), max_rows=100_000)
+    assert report.downcast_columns == {}
+    assert df["Row ID"].dtype == "int64"
+
+
+def test_stratified_default_skips_constant_columns():
+    rows = 20_000
+    frame = pd.DataFrame({
+        "Country": ["United States"] * rows,
+        # "North" is rare: a uniform sample of 200 rows would usually miss it
+        "Region": ["North"] * 10 + ["South", "East", "West"] * ((rows - 10) // 3) + ["South"] * ((rows - 10) % 3),
+        "Sales": range(rows),
+    })
+    df, report = stream_csv(
+        io.BytesIO(frame.to_csv(index=False).encode()),
+        max_rows=200, sample_mode="stratified", first_n=0, chunksize=5_000
+    )
+    assert report.stratify_by == "Region"
+    assert set(df["Region"]) == {"North", "South", "East", "West"}
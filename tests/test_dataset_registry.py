@@ -0,0 +1,8 @@
+import subprocess
+import sys
+
+
+def test_import_leaves_pandas_options_alone():
+    code = "import pandas as pd, utils; print(pd.get_option('mode.copy_on_write'))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "False"
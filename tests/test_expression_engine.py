@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils.expression_engine import ExpressionError, compile_expression
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"Region": ["East", "West", "East"], "Sales": [10.0, 20.0, 30.0]})
+
+
+def test_query_is_rejected(tmp_path):
+    target = tmp_path / "pwned_query"
+    source = f"df.query(\"@pd.io.common.os.system('touch {target}') == 0\")"
+    with pytest.raises(ExpressionError):
+        compile_expression(source)
+    assert not os.path.exists(target)
+
+
+@pytest.mark.parametrize("source", [
+    "df.to_csv('/tmp/out.csv')",
+    "df.__class__",
+    "pd.read_csv('/etc/passwd')",
+    "open('/etc/passwd')",
+])
+def test_unsafe_expressions_are_rejected(source):
+    with pytest.raises(ExpressionError):
+        compile_expression(source)
+
+
+def test_safe_builtins(df):
+    assert compile_expression('df["Sales"].astype(int).astype(str).tolist()').evaluate(df) == ["10", "20", "30"]
+    assert compile_expression('len(df)').evaluate(df) == 3
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('df["Sales"].apply(lambda v: v * 2).tolist()', [20.0, 40.0, 60.0]),
+    ('df["Sales"].map(lambda v: "high" if v > 15 else "low").tolist()', ["low", "high", "high"]),
+    ('df.groupby("Region")["Sales"].agg(lambda s: s.max() - s.min()).tolist()', [20.0, 0.0]),
+    ('[round(v / 10) for v in df["Sales"].tolist()]', [1, 2, 3]),
+])
+def test_lambdas_and_comprehensions(df, source, expected):
+    assert compile_expression(source).evaluate(df) == expected
+
+
+@pytest.mark.parametrize("source", [
+    'df["Sales"].apply(lambda v: v.__class__).tolist()',
+    'df["Sales"].apply(lambda v: open(v)).tolist()',
+    'df["Sales"].apply(lambda f: f()).tolist()',
+    'df["Sales"].apply(lambda v: w).tolist()',
+])
+def test_lambda_bodies_are_checked(source):
+    with pytest.raises(ExpressionError):
+        compile_expression(source)
@@ -0,0 +1,22 @@
+import json
+
+import pandas as pd
+
+from utils import renderers
+
+
+def test_plotly_chart_with_period_index(monkeypatch):
+    df = pd.DataFrame({
+        "Order Date": pd.to_datetime(["2015-01-03", "2015-01-20", "2015-02-07"]),
+        "Sales": [1.0, 2.0, 4.0],
+    })
+    figures = []
+    monkeypatch.setattr(renderers.st, "plotly_chart", lambda fig, **kwargs: figures.append(fig))
+    grouped = 'df.groupby(df["Order Date"].dt.to_period("M"))["Sales"].sum()'
+    spec = f'{{"data": [{{"type": "bar", "x": {grouped}.index.tolist(), "y": {grouped}.tolist()}}]}}'
+
+    renderers.render_plotly_chart(spec, df, max_points=1_000)
+
+    trace = json.loads(figures[0].to_json())["data"][0]
+    assert trace["x"] == ["2015-01", "2015-02"]
+    assert list(figures[0].data[0].y) == [3.0, 4.0]
@@ -0,0 +1,20 @@
+from utils.response_cache import ResponseCache, _cache_keys
+
+
+def _messages(question):
+    return [{"role": "system", "content": "schema"}, {"role": "user", "content": question}]
+
+
+def test_creates_missing_directory(tmp_path):
+    path = tmp_path / "missing" / "nested" / "responses.sqlite3"
+    cache = ResponseCache(path=str(path))
+    cache.store("model", _messages("sales by region"), "answer", 1.0)
+    assert path.exists()
+    assert cache.lookup("model", _messages("sales by region")) == "answer"
+
+
+def test_exact_key_keeps_operators_and_signs():
+    key = lambda question: _cache_keys("model", _messages(question))[0]
+    assert key("sales > 1000 by region") != key("sales < 1000 by region")
+    assert key("-5%") != key("5%")
+    assert key("Sales  by Region?") == key("sales by region")
@@ -2,13 +2,40 @@ from .chat_handler import (
     call_llm_api,
     extract_json_spec,
     extract_vegalite_spec,
-    get_dataset_info
+    get_dataset_info,
+    get_llm_call_stats,
+    stream_completion,
+    stream_llm_api,
+    request_completion,
+    IncrementalSpecExtractor
 )
+from .llm_jobs import (
+    CompletionJob,
+    LLMJobPool,
+    finished_job,
+    job_pending,
+    llm_jobs,
+    ready_spec,
+    render_pending,
+    start_job,
+    submit_completion
+)
+from .context_budget import count_message_tokens, estimate_tokens, fit_to_budget, summarize_answer
+from .response_cache import ResponseCache, response_cache
 from .prompts import (
     get_vegalite_prompt,
     get_plotly_prompt,
     get_echarts_prompt
 )
+from .profile import ColumnProfile, DatasetProfile, get_dataset_profile
+from .fingerprint import assign_fingerprint, dataset_fingerprint
+from .dataset_cache import DiskDatasetCache, content_hash, dataset_cache
+from .dataset_registry import DatasetRegistry, dataset_registry, session_view
+from .data_loader import IngestionReport, StreamingStats, load_csv, mark_sample, sample_info, stream_csv
+from .expression_cache import expression_cache
+from .expression_pool import EvaluationAborted, ExpressionWorkerPool, expression_pool
+from .rollup import RollupCube, get_rollup_cube
+from .tracing import Span, Tracer, render_trace_panel, to_jsonl, to_otlp, tracer
 from .renderers import (
     render_plotly_chart,
     render_echarts_chart
@@ -19,9 +46,58 @@ __all__ = [
     'extract_json_spec',
     'extract_vegalite_spec',
     'get_dataset_info',
+    'get_llm_call_stats',
+    'stream_completion',
+    'stream_llm_api',
+    'request_completion',
+    'IncrementalSpecExtractor',
+    'CompletionJob',
+    'LLMJobPool',
+    'finished_job',
+    'job_pending',
+    'llm_jobs',
+    'ready_spec',
+    'render_pending',
+    'start_job',
+    'submit_completion',
+    'count_message_tokens',
+    'estimate_tokens',
+    'fit_to_budget',
+    'summarize_answer',
+    'ResponseCache',
+    'response_cache',
     'get_vegalite_prompt',
     'get_plotly_prompt',
     'get_echarts_prompt',
+    'ColumnProfile',
+    'DatasetProfile',
+    'get_dataset_profile',
     'render_plotly_chart',
     'render_echarts_chart',
+    'assign_fingerprint',
+    'dataset_fingerprint',
+    'DiskDatasetCache',
+    'content_hash',
+    'dataset_cache',
+    'DatasetRegistry',
+    'dataset_registry',
+    'session_view',
+    'expression_cache',
+    'EvaluationAborted',
+    'ExpressionWorkerPool',
+    'expression_pool',
+    'RollupCube',
+    'get_rollup_cube',
+    'IngestionReport',
+    'load_csv',
+    'mark_sample',
+    'sample_info',
+    'StreamingStats',
+    'stream_csv',
+    'Span',
+    'Tracer',
+    'render_trace_panel',
+    'to_jsonl',
+    'to_otlp',
+    'tracer',
 ]
@@ -1,74 +1,394 @@
-import requests
+import email.utils
 import json
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from .context_budget import count_message_tokens
+from .profile import get_dataset_profile
+from .response_cache import response_cache
+from .tracing import tracer
+
+
+OPENROUTER_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/") + "/chat/completions"
+
+# (connect, read) timeouts in seconds; a hung completion no longer freezes the session
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "120"))
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+# Latency of recent calls, newest last
+_call_log = deque(maxlen=200)
+
+
+def get_session():
+    """Shared keep-alive session so chat turns reuse pooled TLS connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_delay(attempt, response=None):
+    """Seconds to wait before retrying: Retry-After if the server sent one, else full-jitter backoff"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            # An HTTP date; a malformed header falls back to backoff
+            try:
+                seconds = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None and seconds == seconds:  # not NaN
+            return min(max(seconds, 0.0), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
 
+def post_with_retries(url, headers, payload, timeout=None, max_retries=MAX_RETRIES, stream=False):
+    """
+    POST through the shared session, retrying 429/5xx responses and failed connections.
 
-def call_llm_api(api_key, model, messages):
+    Read timeouts are not retried since the provider may already be
+    generating (and billing) the completion. Returns (response, attempts).
+    """
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    session = get_session()
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        except requests.ConnectionError:
+            if attempt == max_retries:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            delay = _retry_delay(attempt, response)
+            response.close()
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response, attempt + 1
+
+
+def record_llm_call(model, latency, attempts, ok, **extra):
+    _call_log.append({"model": model, "latency": latency, "attempts": attempts, "ok": ok, "time": time.time(), **extra})
+
+
+def get_llm_call_stats():
+    """
+    Count, mean/p50/p95 latency (seconds) and retries over recent LLM calls,
+    plus median time to first token of streamed calls and the last prompt size
+    """
+    calls = list(_call_log)
+    if not calls:
+        return {"calls": 0}
+    latencies = sorted(call["latency"] for call in calls)
+    first_tokens = sorted(call["first_token"] for call in calls if call.get("first_token") is not None)
+    return {
+        "calls": len(calls),
+        "errors": sum(not call["ok"] for call in calls),
+        "retries": sum(call["attempts"] - 1 for call in calls),
+        "last": calls[-1]["latency"],
+        "mean": sum(latencies) / len(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+        "first_token_p50": first_tokens[len(first_tokens) // 2] if first_tokens else None,
+        "prompt_tokens": calls[-1].get("prompt_tokens"),
+    }
+
+
+def _headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+def call_llm_api(api_key, model, messages, timeout=None, max_retries=MAX_RETRIES, url=None):
     """Call OpenRouter API and return assistant message"""
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": model,
-            "messages": messages
-        }
-    )
-    response.raise_for_status()
-    response_data = response.json()
-    return response_data["choices"][0]["message"]["content"]
+    prompt_tokens = count_message_tokens(messages)
+    start = time.perf_counter()
+    attempts = 0
+    with tracer.span("llm_call", model=model, stream=False, prompt_tokens=prompt_tokens) as span:
+        try:
+            response, attempts = post_with_retries(
+                url or OPENROUTER_URL,
+                _headers(api_key),
+                {
+                    "model": model,
+                    "messages": messages
+                },
+                timeout=timeout,
+                max_retries=max_retries
+            )
+            # Without streaming the body is read before post returns, so this is the full response time
+            span.set(ttfb_ms=round((time.perf_counter() - start) * 1000, 1), attempts=attempts)
+            response_data = response.json()
+            content = response_data["choices"][0]["message"]["content"]
+        except Exception:
+            record_llm_call(model, time.perf_counter() - start, max(attempts, 1), ok=False, prompt_tokens=prompt_tokens)
+            raise
+        span.set(response_chars=len(content))
+    record_llm_call(model, time.perf_counter() - start, attempts, ok=True, prompt_tokens=prompt_tokens)
+    return content
+
+
+def stream_llm_api(api_key, model, messages, timeout=None, max_retries=MAX_RETRIES, url=None):
+    """
+    Call OpenRouter with "stream": true and yield content deltas as they arrive.
+
+    Parses the server-sent events (data: {...} lines, ": ..." keep-alive
+    comments, data: [DONE]). Closing the generator early closes the response.
+    """
+    prompt_tokens = count_message_tokens(messages)
+    start = time.perf_counter()
+    first_token = None
+    attempts = 0
+    ok = False
+    error = None
+    # Not made current: the caller's code runs between yields
+    span = tracer.start("llm_call", model=model, stream=True, prompt_tokens=prompt_tokens)
+    try:
+        response, attempts = post_with_retries(
+            url or OPENROUTER_URL,
+            _headers(api_key),
+            {
+                "model": model,
+                "messages": messages,
+                "stream": True
+            },
+            timeout=timeout,
+            max_retries=max_retries,
+            stream=True
+        )
+        span.set(ttfb_ms=round((time.perf_counter() - start) * 1000, 1), attempts=attempts)
+        # SSE has no charset in its content type; requests would assume latin-1
+        response.encoding = "utf-8"
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"].get("message", "Streaming error"))
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    yield delta
+        ok = True
+    except GeneratorExit:
+        # Caller stopped reading (e.g. the spec was already complete)
+        ok = True
+        raise
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if first_token is not None:
+            span.set(first_token_ms=round(first_token * 1000, 1))
+        tracer.end(span, error)
+        record_llm_call(
+            model, time.perf_counter() - start, max(attempts, 1), ok=ok,
+            first_token=first_token, prompt_tokens=prompt_tokens
+        )
+
+
+class IncrementalSpecExtractor:
+    """
+    Watches streamed text for the first complete top-level JSON object.
+
+    feed() returns True once the closing brace has arrived, so spec
+    extraction and chart rendering can start without waiting for the rest
+    of the response. finished also waits for the closing ``` of a fenced spec.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.complete = False
+        self.end = None  # index just past the spec's closing brace
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        offset = len(self.text)
+        self.text += chunk
+        if self.complete:
+            return True
+
+        for i, char in enumerate(chunk, offset):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._start is not None:
+                self._in_string = True
+            elif char == "{":
+                if self._start is None:
+                    self._start = i
+                self._depth += 1
+            elif char == "}" and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+                    self.end = i + 1
+                    return True
+        return False
+
+    @property
+    def finished(self):
+        """True once the spec is complete and the ``` fence it was opened in (if any) is closed"""
+        if not self.complete or self.text.count("```", 0, self._start) % 2 == 0:
+            return self.complete
+        return "```" in self.text[self.end:]
+
+
+def stream_completion(api_key, model, messages, on_text=None, on_spec=None, stop_when_complete=False,
+                      min_interval=0.05):
+    """
+    Stream a completion, calling on_text(text_so_far) as tokens arrive.
+
+    on_spec(text_so_far) is called once, as soon as the first JSON object in
+    the response is complete, so the chart can be rendered while the rest of
+    the reply streams in. The stream is read to the end, unless
+    stop_when_complete, which closes it once the spec and its code fence are
+    complete. Returns the accumulated text.
+    """
+    extractor = IncrementalSpecExtractor()
+    last_update = 0.0
+    spec_sent = False
+    stream = stream_llm_api(api_key, model, messages)
+    try:
+        for delta in stream:
+            complete = extractor.feed(delta)
+            now = time.perf_counter()
+            if on_text is not None and ((complete and not spec_sent) or now - last_update >= min_interval):
+                on_text(extractor.text)
+                last_update = now
+            if complete and not spec_sent:
+                spec_sent = True
+                if on_spec is not None:
+                    on_spec(extractor.text)
+            if stop_when_complete and extractor.finished:
+                break
+    finally:
+        stream.close()
+
+    if on_text is not None:
+        on_text(extractor.text)
+    return extractor.text
+
+
+def request_completion(api_key, model, messages, on_text=None, stream=True, cache=response_cache, fuzzy=False,
+                       on_spec=None):
+    """
+    Get the assistant reply for messages, from the response cache when possible.
+
+    On a miss the completion is streamed (or fetched in one call) and
+    stored with its latency. on_text(text) receives partial and final text;
+    when streaming, on_spec(text) is called once the spec is complete (see
+    stream_completion). Pass cache=None to always call the API.
+    """
+    with tracer.span("request_completion", model=model, stream=stream) as span:
+        if cache is not None:
+            cached = cache.lookup(model, messages, fuzzy=fuzzy)
+            span.set(cache="hit" if cached is not None else "miss")
+            if cached is not None:
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+        start = time.perf_counter()
+        if stream:
+            text = stream_completion(api_key, model, messages, on_text=on_text, on_spec=on_spec)
+        else:
+            text = call_llm_api(api_key, model, messages)
+            if on_text is not None:
+                on_text(text)
+
+        if cache is not None:
+            cache.store(model, messages, text, time.perf_counter() - start)
+        return text
 
 
 def extract_json_spec(text):
-    """Extract JSON from LLM response"""
-    spec_text = text.strip()
-    if "```" in spec_text:
-        spec_text = spec_text.split("```json")[-1].split("```")[0].strip()
-        if not spec_text:
-            spec_text = text.split("```")[-2].strip()
+    """
+    Extract JSON from LLM response: the last ```json block, else the first
+    ``` block (either may be unclosed), up to the end of the first object
+    """
+    with tracer.span("extract_spec", chars=len(text)) as span:
+        spec_text = text.strip()
+        if "```json" in spec_text:
+            spec_text = spec_text.split("```json")[-1].split("```")[0].strip()
+        elif "```" in spec_text:
+            block = spec_text.split("```", 2)[1]
+            # Drop a language tag on the opening fence line
+            tag, newline, rest = block.partition("\n")
+            if newline and not tag.strip().startswith(("{", "[")):
+                block = rest
+            spec_text = block.strip()
+        # Drop anything after the spec, e.g. an explanation following an unfenced object
+        extractor = IncrementalSpecExtractor()
+        if spec_text.startswith("{") and extractor.feed(spec_text):
+            spec_text = spec_text[:extractor.end]
+        span.set(spec_chars=len(spec_text))
     return spec_text
 
 
 def extract_vegalite_spec(assistant_message):
     """Extract Vega-Lite spec from LLM response"""
-    if "{" in assistant_message and "}" in assistant_message:
-        start_idx = assistant_message.find("{")
-        brace_count = 0
-        end_idx = start_idx
-        for i in range(start_idx, len(assistant_message)):
-            if assistant_message[i] == "{":
-                brace_count += 1
-            elif assistant_message[i] == "}":
-                brace_count -= 1
-                if brace_count == 0:
-                    end_idx = i + 1
-                    break
+    with tracer.span("extract_spec", chars=len(assistant_message)):
+        if "{" in assistant_message and "}" in assistant_message:
+            start_idx = assistant_message.find("{")
+            brace_count = 0
+            end_idx = start_idx
+            for i in range(start_idx, len(assistant_message)):
+                if assistant_message[i] == "{":
+                    brace_count += 1
+                elif assistant_message[i] == "}":
+                    brace_count -= 1
+                    if brace_count == 0:
+                        end_idx = i + 1
+                        break
 
-        spec_str = assistant_message[start_idx:end_idx]
-        spec_data = json.loads(spec_str)
+            spec_str = assistant_message[start_idx:end_idx]
+            spec_data = json.loads(spec_str)
 
-        if "$schema" in spec_data or "mark" in spec_data:
-            return spec_data
-    return None
+            if "$schema" in spec_data or "mark" in spec_data:
+                return spec_data
+        return None
 
 
 def get_dataset_info(df):
-    """Get dataset context for LLM"""
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-
-    return f"""
-Dataset Information:
-Total Records: {len(df)}
-Columns: {', '.join(df.columns)}
-
-Numeric columns: {', '.join(numeric_cols)}
-Categorical columns: {', '.join(categorical_cols)}
-
-Sample data (first 3 rows):
-{df.head(3).to_string()}
-
-Data types:
-{df.dtypes.to_string()}
-""", numeric_cols, categorical_cols
+    """Get dataset context for LLM (served from the cached DatasetProfile)"""
+    profile = get_dataset_profile(df)
+    return profile.dataset_info, profile.numeric_cols, profile.categorical_cols
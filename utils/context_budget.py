@@ -0,0 +1,99 @@
+import re
+
+
+# Turns (user question + answer) sent verbatim; older answers are summarized
+KEEP_TURNS = 3
+# Upper bound for the conversation history, excluding the system prompt
+MAX_HISTORY_TOKENS = 4_000
+# Role/formatting tokens the chat format adds to every message
+MESSAGE_OVERHEAD = 4
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_CHART_TYPE = re.compile(r'"(?:type|mark)"\s*:\s*"(\w+)"')
+_TITLE = re.compile(r'"(?:text|title)"\s*:\s*"([^"]{1,80})"')
+_COLUMN = re.compile(r'(?:df\[|groupby\(|"field"\s*:)\s*["\']([^"\']+)["\']')
+# Values of "type"/"mark" that name a chart rather than an axis or encoding type
+CHART_TYPES = {
+    'area', 'arc', 'bar', 'box', 'boxplot', 'candlestick', 'circle', 'funnel', 'gauge', 'heatmap',
+    'histogram', 'line', 'pie', 'point', 'radar', 'rect', 'sankey', 'scatter', 'scattergl',
+    'sunburst', 'tick', 'treemap', 'violin', 'waterfall',
+}
+
+
+def estimate_tokens(text):
+    """
+    Approximate the BPE token count of text without a tokenizer.
+
+    Words count one token per ~6 letters, digit runs one per 3 digits and
+    every punctuation mark one token, which tracks common LLM tokenizers
+    closely enough for budgeting JSON-heavy chat history.
+    """
+    count = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        count += 1 + (len(piece) - 1) // (6 if piece[0].isalpha() else 3)
+    return count
+
+
+def count_message_tokens(messages):
+    """Estimated prompt tokens for a list of chat messages"""
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def _unique(values):
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def summarize_answer(content, max_chars=300):
+    """
+    Shorten an earlier assistant answer: a chart spec becomes a one-line
+    description (chart types, title, columns); plain text is truncated.
+    """
+    start = content.find("{")
+    types = _unique(t for t in _CHART_TYPE.findall(content, start) if t in CHART_TYPES) if start != -1 else []
+    if not types:
+        return content if len(content) <= max_chars else content[:max_chars].rstrip() + "…"
+
+    spec = content[start:]
+    title = _TITLE.search(spec)
+    columns = _unique(_COLUMN.findall(spec))
+
+    parts = [f"{'/'.join(types[:3])} chart"]
+    if title:
+        parts.append(f"titled '{title.group(1)}'")
+    if columns:
+        parts.append(f"using {', '.join(columns[:6])}")
+
+    prefix = content[:start].strip()
+    prefix = prefix[:max_chars] + " " if prefix else ""
+    return f"{prefix}[Earlier answer: {' '.join(parts)} - spec omitted]"
+
+
+def fit_to_budget(system_prompt, history, keep_turns=None, max_tokens=MAX_HISTORY_TOKENS):
+    """
+    Build the messages for a request from the full chat history.
+
+    The last keep_turns (default KEEP_TURNS) user questions and everything after them are sent
+    verbatim; earlier assistant answers are replaced by summaries. If the
+    history still exceeds max_tokens, the oldest messages are dropped
+    (the latest user message is always kept).
+    """
+    user_positions = [i for i, m in enumerate(history) if m["role"] == "user"]
+    keep_turns = min(max(keep_turns or KEEP_TURNS, 1), len(user_positions))
+    verbatim_from = user_positions[-keep_turns] if keep_turns else 0
+
+    trimmed = [
+        {**m, "content": summarize_answer(m["content"])} if m["role"] == "assistant" and i < verbatim_from else m
+        for i, m in enumerate(history)
+    ]
+
+    sizes = [estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in trimmed]
+    total = sum(sizes)
+    first = 0
+    while total > max_tokens and first < len(trimmed) - 1:
+        total -= sizes[first]
+        first += 1
+    # Start on a user message so the conversation still alternates correctly
+    while first < len(trimmed) - 1 and trimmed[first]["role"] != "user":
+        first += 1
+
+    return [{"role": "system", "content": system_prompt}, *trimmed[first:]]
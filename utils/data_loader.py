@@ -0,0 +1,431 @@
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+from .dates import date_format_candidates, parse_dates
+
+
+SAMPLE_ROWS = 10_000
+# A string column is stored as category when its sample has at most this many
+# distinct values and they repeat on average at least twice.
+MAX_CATEGORIES = 1_000
+MAX_UNIQUE_RATIO = 0.5
+# The default stratification column has between 2 and this many distinct values
+MAX_STRATA = 50
+# Distinct raw values of a date column tracked while streaming, so per-day totals stay exact
+MAX_DATE_VALUES = 100_000
+
+# df.attrs key marking a frame that holds only a sample of the file: {"rows": total rows, "mode": sample mode}
+SAMPLE_ATTR = "chatbi_sample"
+
+
+@dataclass
+class IngestionReport:
+    """What load_csv did to the raw CSV columns"""
+    rows: int = 0
+    engine: str = "c"
+    memory_before: int = 0  # estimated from the sample, in bytes
+    memory_after: int = 0
+    date_columns: dict = field(default_factory=dict)  # column -> format
+    categorical_columns: list = field(default_factory=list)
+    downcast_columns: dict = field(default_factory=dict)  # column -> new dtype
+    sample_mode: str = None  # set when only a bounded sample of rows was kept
+    stratify_by: str = None  # column the stratified sample is balanced across
+    stats: "StreamingStats" = None  # exact statistics over every row read
+
+    @property
+    def memory_saved(self):
+        return max(self.memory_before - self.memory_after, 0)
+
+    @property
+    def sampled(self):
+        return self.sample_mode is not None
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def _plan_columns(sample):
+    """
+    Pick date and categorical columns from a sample of the file.
+
+    Date columns map to every format that parsed the sample, preferred first;
+    the one used is settled against the full column (see parse_dates).
+    """
+    date_columns = {}
+    categorical_columns = []
+
+    for col in sample.columns:
+        series = sample[col]
+        if not _is_text(series):
+            continue
+
+        formats = date_format_candidates(series)
+        if formats:
+            date_columns[col] = formats
+            continue
+
+        non_null = series.dropna()
+        unique = non_null.nunique()
+        if 0 < unique <= MAX_CATEGORIES and unique <= len(non_null) * MAX_UNIQUE_RATIO:
+            categorical_columns.append(col)
+
+    return date_columns, categorical_columns
+
+
+def _downcast(df):
+    """
+    Downcast integer columns, and float columns only when no precision is lost.
+
+    Arithmetic on the result stays in the narrow dtype (an int16 column times
+    10 can wrap), so loaders only do this when asked to.
+    """
+    changed = {}
+    for col in df.select_dtypes(include=['integer', 'floating']).columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.ArrowDtype):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            downcast = pd.to_numeric(series, downcast='integer')
+        else:
+            downcast = pd.to_numeric(series, downcast='float')
+            if not downcast.astype(series.dtype).equals(series):
+                continue
+        if downcast.dtype != series.dtype:
+            df[col] = downcast
+            changed[col] = str(downcast.dtype)
+    return changed
+
+
+def load_csv(file, use_arrow=False, downcast=False):
+    """
+    Read a CSV into compact, typed columns.
+
+    A sample of the file decides which text columns are dates (parsed with an
+    explicit format, including dd/mm/yyyy, that must parse every value of the
+    column or it stays text) and which are low-cardinality
+    categories. With downcast numeric columns are narrowed afterwards (see
+    _downcast). With use_arrow the pyarrow parser and Arrow-backed dtypes are
+    used when pyarrow is installed.
+
+    Returns (df, IngestionReport).
+    """
+    sample = pd.read_csv(file, nrows=SAMPLE_ROWS)
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+    date_columns, categorical_columns = _plan_columns(sample)
+
+    read_kwargs = {"dtype": {col: "category" for col in categorical_columns}}
+    engine = "c"
+    if use_arrow:
+        try:
+            import pyarrow  # noqa: F401
+            read_kwargs.update(engine="pyarrow", dtype_backend="pyarrow")
+            engine = "pyarrow"
+        except ImportError:
+            pass
+
+    df = pd.read_csv(file, **read_kwargs)
+
+    parsed_formats = {}
+    for col, formats in date_columns.items():
+        parsed, fmt = parse_dates(df[col], formats)
+        if parsed is not None:
+            df[col] = parsed
+            parsed_formats[col] = fmt
+
+    report = IngestionReport(
+        rows=len(df),
+        engine=engine,
+        date_columns=parsed_formats,
+        categorical_columns=categorical_columns,
+        downcast_columns=_downcast(df) if downcast else {},
+    )
+    if len(sample):
+        per_row = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+        report.memory_before = int(per_row * len(df))
+    report.memory_after = int(df.memory_usage(deep=True, index=False).sum())
+
+    return df, report
+
+
+SAMPLE_MODES = ("reservoir", "stratified")
+
+
+class StreamingStats:
+    """
+    Running per-column statistics built chunk by chunk.
+
+    Numeric columns keep count/sum/min/max, dimension columns keep value
+    counts, and every (dimension, numeric) pair keeps per-group
+    sum/count/min/max, so exact aggregates over the whole file remain
+    available after the rows themselves are dropped. Date columns are
+    tracked the same way by their raw text values, which are grouped into
+    days once their format is known (date_formats). A dimension whose
+    distinct values exceed MAX_CATEGORIES (MAX_DATE_VALUES for dates) stops
+    being tracked.
+    """
+
+    AGGS = ['sum', 'count', 'min', 'max']
+    COMBINE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+    def __init__(self, dimensions, measures, date_columns=()):
+        self.rows = 0
+        self.nulls = {}
+        self.numeric = {}
+        self.value_counts = {dim: None for dim in [*dimensions, *date_columns]}
+        self.max_groups = {
+            **{dim: MAX_CATEGORIES for dim in dimensions}, **{col: MAX_DATE_VALUES for col in date_columns}
+        }
+        self.measures = list(measures)
+        self.date_columns = list(date_columns)
+        self.group_aggregates = {}
+        self.date_formats = {}  # date column -> format its text values parse with, set after the last chunk
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for col, count in chunk.isna().sum().items():
+            self.nulls[col] = self.nulls.get(col, 0) + int(count)
+
+        for col in self.measures:
+            series = chunk[col]
+            current = {"count": int(series.count()), "sum": series.sum(), "min": series.min(), "max": series.max()}
+            previous = self.numeric.get(col)
+            if previous is not None:
+                current = {
+                    "count": previous["count"] + current["count"],
+                    "sum": previous["sum"] + current["sum"],
+                    "min": np.nanmin([previous["min"], current["min"]]),
+                    "max": np.nanmax([previous["max"], current["max"]]),
+                }
+            self.numeric[col] = current
+
+        for dim in list(self.value_counts):
+            counts = chunk[dim].value_counts()
+            previous = self.value_counts[dim]
+            if previous is not None:
+                counts = previous.add(counts, fill_value=0).astype('int64')
+            if len(counts) > self.max_groups[dim]:
+                # Too many groups to keep exact aggregates for
+                del self.value_counts[dim]
+                for measure in self.measures:
+                    self.group_aggregates.pop((dim, measure), None)
+                continue
+            self.value_counts[dim] = counts
+
+            if not self.measures:
+                continue
+            grouped = chunk.groupby(dim)[self.measures].agg(self.AGGS)
+            for measure in self.measures:
+                part = grouped[measure]
+                previous = self.group_aggregates.get((dim, measure))
+                if previous is not None:
+                    part = pd.concat([previous, part]).groupby(level=0).agg(self.COMBINE)
+                self.group_aggregates[(dim, measure)] = part
+
+    def groupby(self, dim, measure, agg):
+        """Exact df.groupby(dim)[measure].<agg>() over every row read, or None if not tracked"""
+        table = self.group_aggregates.get((dim, measure))
+        if table is None:
+            return None
+        table = table.sort_index()
+        if agg == 'mean':
+            result = table['sum'] / table['count']
+        elif agg in self.AGGS:
+            result = table[agg]
+        else:
+            return None
+        result.index.name = dim
+        return result.rename(measure)
+
+    def size(self, dim):
+        """Exact df.groupby(dim).size(), or None if not tracked"""
+        counts = self.value_counts.get(dim)
+        if counts is None:
+            return None
+        counts = counts.sort_index()
+        counts.index.name = dim
+        return counts.rename(None)
+
+    def table(self, dim):
+        """
+        Exact aggregates of every measure per group of dim over every row read,
+        as {"size": Series, "sum"/"count"/"min"/"max": DataFrame of measures}
+        sorted by group, or None if dim is not tracked. Date columns are
+        grouped by day.
+        """
+        counts = self.value_counts.get(dim)
+        if counts is None:
+            return None
+        table = {'size': counts.rename(None)}
+        for agg in self.AGGS:
+            table[agg] = pd.DataFrame(
+                {measure: self.group_aggregates[(dim, measure)][agg] for measure in self.measures},
+                index=counts.index
+            )
+
+        if dim in self.date_columns:
+            fmt = self.date_formats.get(dim)
+            if fmt is None:
+                return None
+            days = pd.to_datetime(counts.index.to_series(), format=fmt).dt.normalize().to_numpy()
+            table = {
+                name: values.groupby(days).agg('sum' if name == 'size' else self.COMBINE[name])
+                for name, values in table.items()
+            }
+        for name, values in table.items():
+            values.index.name = dim
+            table[name] = values.sort_index()
+        return table
+
+    def summary(self):
+        """One row per column: non-null count, nulls and numeric sum/min/max/mean"""
+        rows = []
+        for col, nulls in self.nulls.items():
+            row = {"column": col, "non_null": self.rows - nulls, "nulls": nulls}
+            stats = self.numeric.get(col)
+            if stats:
+                row.update(
+                    sum=stats["sum"], min=stats["min"], max=stats["max"],
+                    mean=stats["sum"] / stats["count"] if stats["count"] else None
+                )
+            elif self.value_counts.get(col) is not None:
+                row["distinct"] = len(self.value_counts[col])
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("column")
+
+
+def mark_sample(df, report):
+    """Record in df.attrs (carried by every view) that df is a sample of report.rows rows"""
+    if report.sampled:
+        df.attrs[SAMPLE_ATTR] = {"rows": report.rows, "mode": report.sample_mode}
+    return df
+
+
+def sample_info(df):
+    """{"rows", "mode"} if df holds only a sample of its file (see mark_sample), else None"""
+    return df.attrs.get(SAMPLE_ATTR)
+
+
+def _file_size(file):
+    size = getattr(file, "size", None)
+    if size is None and hasattr(file, "seek"):
+        position = file.tell()
+        size = file.seek(0, 2)
+        file.seek(position)
+    return size
+
+
+def _default_stratum(head, categorical_columns):
+    """
+    The categorical column a stratified sample is balanced across by default.
+
+    The one with the fewest distinct values in head, ignoring constant columns
+    (one stratum is just a random sample) and ones with more than MAX_STRATA
+    values; None if no column qualifies.
+    """
+    counts = {col: head[col].nunique() for col in categorical_columns}
+    candidates = [col for col, count in counts.items() if 1 < count <= MAX_STRATA]
+    return min(candidates, key=counts.get) if candidates else None
+
+
+def _keep_sample(sample, chunk, max_rows, sample_mode, stratify_by, rng):
+    """Merge a chunk into the bounded sample using random keys (uniform reservoir)"""
+    chunk = chunk.assign(_sample_key=rng.random(len(chunk)))
+    pool = pd.concat([sample, chunk]) if sample is not None else chunk
+
+    if sample_mode == "stratified" and stratify_by:
+        head = pool[pool["_sample_key"] < 0]  # the first-N rows are pinned with negative keys
+        rest = pool[pool["_sample_key"] >= 0]
+        # Round-robin across strata: every group's k-th row before any group's (k+1)-th
+        rank = rest.groupby(stratify_by, observed=True, dropna=False)["_sample_key"].rank(method="first")
+        rest = rest.assign(_stratum_rank=rank).sort_values(["_stratum_rank", "_sample_key"])
+        rest = rest.head(max_rows - len(head)).drop(columns="_stratum_rank")
+        return pd.concat([head, rest])
+
+    return pool.nsmallest(max_rows, "_sample_key") if len(pool) > max_rows else pool
+
+
+def stream_csv(file, max_rows=100_000, sample_mode="reservoir", stratify_by=None,
+               chunksize=100_000, first_n=None, progress=None, seed=0, downcast=False):
+    """
+    Read a CSV in chunks, keeping at most max_rows rows in memory.
+
+    sample_mode "reservoir" keeps a uniform random sample; "stratified" keeps
+    the first first_n rows (default half the budget) plus a sample balanced
+    across the values of stratify_by (default: see _default_stratum).
+    StreamingStats in the report hold exact aggregates over every row, and
+    df.attrs records that df is a sample (see sample_info). progress(fraction) is called after each chunk; downcast is
+    as in load_csv.
+
+    Returns (sample_df, IngestionReport).
+    """
+    if sample_mode not in SAMPLE_MODES:
+        raise ValueError(f"Unknown sample mode: {sample_mode}")
+
+    head = pd.read_csv(file, nrows=SAMPLE_ROWS)
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+    date_columns, categorical_columns = _plan_columns(head)
+    if sample_mode == "stratified" and stratify_by is None:
+        stratify_by = _default_stratum(head, categorical_columns)
+    if first_n is None:
+        first_n = max_rows // 2 if sample_mode == "stratified" else 0
+
+    measures = head.select_dtypes(include=['number']).columns.tolist()
+    stats = StreamingStats(categorical_columns, measures, date_columns)
+    rng = np.random.default_rng(seed)
+    total_size = _file_size(file)
+    memory_before = 0
+    sample = None
+
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        memory_before += int(chunk.memory_usage(deep=True, index=False).sum())
+        # Date columns stay text until the end; each chunk rules out the formats it doesn't fit
+        for col, formats in date_columns.items():
+            date_columns[col] = [fmt for fmt in formats if parse_dates(chunk[col], [fmt])[0] is not None]
+
+        seen = stats.rows
+        stats.update(chunk)
+
+        if seen < first_n:
+            pinned = chunk.iloc[:first_n - seen].assign(_sample_key=-1.0)
+            sample = pd.concat([sample, pinned]) if sample is not None else pinned
+            chunk = chunk.iloc[first_n - seen:]
+        sample = _keep_sample(sample, chunk, max_rows, sample_mode, stratify_by, rng)
+
+        if progress is not None and total_size and hasattr(file, "tell"):
+            progress(min(file.tell() / total_size, 1.0))
+
+    if sample is None:
+        sample = head.iloc[:0].assign(_sample_key=0.0)
+    # Restore file order, then apply the compact dtypes to the (small) sample
+    df = sample.sort_index().drop(columns="_sample_key").reset_index(drop=True)
+    for col in categorical_columns:
+        df[col] = df[col].astype("category")
+    parsed_formats = {}
+    for col, formats in date_columns.items():
+        parsed, fmt = parse_dates(df[col], formats[:1])
+        if parsed is not None:
+            df[col] = parsed
+            parsed_formats[col] = fmt
+    stats.date_formats = parsed_formats
+
+    report = IngestionReport(
+        rows=stats.rows,
+        date_columns=parsed_formats,
+        categorical_columns=categorical_columns,
+        downcast_columns=_downcast(df) if downcast else {},
+        sample_mode=sample_mode,
+        stratify_by=stratify_by if sample_mode == "stratified" else None,
+        stats=stats,
+        memory_before=memory_before,
+        memory_after=int(df.memory_usage(deep=True, index=False).sum()),
+    )
+    mark_sample(df, report)
+    if progress is not None:
+        progress(1.0)
+
+    return df, report
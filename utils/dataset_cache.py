@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import pandas as pd
+
+
+# Bump when the on-disk layout or ingestion output changes
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chat-bi", "datasets")
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+def content_hash(file, **options):
+    """
+    Hash the raw bytes of an upload together with the options used to load it.
+
+    Uses the in-memory buffer of BytesIO-like uploads (st.file_uploader)
+    without copying; other file objects are read and rewound.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(json.dumps([CACHE_FORMAT_VERSION, options], sort_keys=True).encode())
+
+    if hasattr(file, "getbuffer"):
+        hasher.update(file.getbuffer())
+    else:
+        position = file.tell()
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(block)
+        file.seek(position)
+
+    return hasher.hexdigest()
+
+
+class DiskDatasetCache:
+    """
+    Content-addressed cache of loaded datasets on local disk.
+
+    Each entry is an uncompressed Feather (Arrow IPC) file that is memory
+    mapped on load, plus a pickled IngestionReport. File modification times
+    track recency; the least recently used entries are deleted once the
+    directory exceeds max_bytes. Needs pyarrow - without it every lookup is
+    a miss and nothing is written.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv("CHATBI_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = int(max_bytes or os.getenv("CHATBI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self._lock = threading.Lock()
+        try:
+            import pyarrow.feather  # noqa: F401
+            self.available = True
+        except ImportError:
+            self.available = False
+
+    def _paths(self, key):
+        base = os.path.join(self.root, key)
+        return base + ".feather", base + ".report.pkl"
+
+    def path_for(self, key):
+        """Feather file for key, or None if it is not cached"""
+        data_path, _ = self._paths(key)
+        return data_path if os.path.exists(data_path) else None
+
+    def load(self, key, zero_copy=False):
+        """
+        Return (df, report) for key, or None on a miss.
+
+        With zero_copy, numeric and date columns without nulls stay read-only
+        views of the memory-mapped file, so processes loading the same entry
+        share those pages; other columns are still copied.
+        """
+        if not self.available:
+            return None
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        data_path, report_path = self._paths(key)
+        try:
+            with open(report_path, "rb") as f:
+                report = pickle.load(f)
+            table = feather.read_table(data_path, memory_map=True)
+        except (OSError, pickle.UnpicklingError, pa.ArrowInvalid):
+            return None
+
+        types_mapper = None
+        if report.engine == "pyarrow":
+            # Restore Arrow-backed dtypes, but keep categories and dates as pandas types
+            def types_mapper(arrow_type):
+                if pa.types.is_dictionary(arrow_type) or pa.types.is_timestamp(arrow_type):
+                    return None
+                return pd.ArrowDtype(arrow_type)
+
+        # split_blocks keeps each column its own block, so no column is copied to consolidate them
+        df = table.to_pandas(types_mapper=types_mapper, split_blocks=zero_copy)
+
+        # Mark as recently used
+        for path in (data_path, report_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return df, report
+
+    def store(self, key, df, report):
+        """Write an entry atomically, then evict down to the byte budget"""
+        if not self.available:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        data_path, report_path = self._paths(key)
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            # One record batch, so each column maps to one contiguous buffer that can be used in place
+            df.reset_index(drop=True).to_feather(
+                data_path + tmp_suffix, compression="uncompressed", chunksize=max(len(df), 1)
+            )
+            with open(report_path + tmp_suffix, "wb") as f:
+                pickle.dump(report, f)
+            os.replace(report_path + tmp_suffix, report_path)
+            os.replace(data_path + tmp_suffix, data_path)
+        except (OSError, ValueError, TypeError):
+            # Unsupported column types or a full disk - just don't cache
+            for path in (data_path + tmp_suffix, report_path + tmp_suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        self.evict()
+
+    def entries(self):
+        """(key, size in bytes, last used) for every cached dataset, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".feather"):
+                continue
+            key = name[:-len(".feather")]
+            size = 0
+            last_used = 0
+            for path in self._paths(key):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size += stat.st_size
+                last_used = max(last_used, stat.st_mtime)
+            entries.append((key, size, last_used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for key, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+
+
+dataset_cache = DiskDatasetCache()
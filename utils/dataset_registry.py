@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from .dataset_cache import content_hash
+
+
+# Distinct datasets kept in memory per process, least recently used evicted first
+MAX_SHARED_DATASETS = 4
+# Uploads whose content hash is remembered, so reruns don't rehash the file
+MAX_UPLOAD_KEYS = 64
+
+
+def session_view(df):
+    """
+    Zero-copy view of a shared frame.
+
+    Relies on pandas copy-on-write, which the app enables at startup: a view,
+    and anything derived from it (df.assign(...), filters, sorts), references
+    the shared columns and copies one only when it is modified, so the shared
+    data never changes and .assign() doesn't copy the whole frame.
+    """
+    return df.copy(deep=False)
+
+
+class DatasetRegistry:
+    """
+    Loaded datasets shared by every session of the process, keyed by content hash.
+
+    st.cache_data hands every session and rerun its own unpickled copy of the
+    DataFrame; here one frame is kept per distinct dataset and each caller
+    gets a session_view of it, so memory grows with datasets rather than
+    sessions. A dataset requested again while it is still loading waits for
+    that load instead of starting another one.
+    """
+
+    def __init__(self, max_datasets=MAX_SHARED_DATASETS):
+        self.max_datasets = max_datasets
+        self.hits = 0
+        self.loads = 0
+        self._entries = OrderedDict()  # key -> (df, report)
+        self._loading = {}  # key -> lock held while that dataset loads
+        self._upload_keys = OrderedDict()  # (upload id, options) -> key
+        self._lock = threading.Lock()
+
+    def key_for(self, file, **options):
+        """content_hash of an upload, computed once per st.file_uploader upload"""
+        upload_id = getattr(file, "file_id", None)
+        if upload_id is None:
+            return content_hash(file, **options)
+
+        memo_key = (upload_id, tuple(sorted(options.items())))
+        with self._lock:
+            key = self._upload_keys.get(memo_key)
+        if key is None:
+            key = content_hash(file, **options)
+            with self._lock:
+                self._upload_keys[memo_key] = key
+                while len(self._upload_keys) > MAX_UPLOAD_KEYS:
+                    self._upload_keys.popitem(last=False)
+        return key
+
+    def get(self, key, load):
+        """(view, report) for key; load() -> (df, report) runs only if the dataset isn't shared yet"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                loading = self._loading.setdefault(key, threading.Lock())
+
+        if entry is None:
+            with loading:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self.hits += 1
+                if entry is None:
+                    try:
+                        entry = load()
+                        with self._lock:
+                            self._entries[key] = entry
+                            self.loads += 1
+                            while len(self._entries) > self.max_datasets:
+                                self._entries.popitem(last=False)
+                    finally:
+                        with self._lock:
+                            self._loading.pop(key, None)
+
+        df, report = entry
+        return session_view(df), report
+
+    def stats(self):
+        """Shared datasets, their in-memory size, and how often a load was avoided"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "datasets": len(entries),
+            "bytes": sum(
+                report.memory_after or int(df.memory_usage(deep=False).sum()) for df, report in entries
+            ),
+            "hits": self.hits,
+            "loads": self.loads,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._upload_keys.clear()
+
+
+dataset_registry = DatasetRegistry()
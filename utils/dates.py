@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+from .fingerprint import dataset_fingerprint
+
+
+# Day-first formats come before month-first ones so that ambiguous samples
+# (every day <= 12) follow the same dayfirst=True convention as the prompts.
+DATE_FORMATS = [
+    '%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y', '%m-%d-%Y',
+    '%d.%m.%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y %H:%M',
+    '%m/%d/%Y %H:%M', '%d/%m/%y', '%m/%d/%y',
+]
+
+
+def _formats(dayfirst):
+    """DATE_FORMATS with day-first or month-first formats tried first"""
+    if dayfirst:
+        return DATE_FORMATS
+    return sorted(DATE_FORMATS, key=lambda fmt: '%d' in fmt and fmt.find('%d') < fmt.find('%m'))
+
+
+def date_format_candidates(values, sample_size=500, dayfirst=True):
+    """
+    Every format in DATE_FORMATS that parses all sampled values, preferred first.
+
+    values is any iterable/Series of strings; only non-null values are sampled.
+    With dayfirst=False month-first formats are tried before day-first ones.
+    A sample where every day is <= 12 yields both orders, so the caller can
+    settle on one after seeing the whole column (see parse_dates).
+    """
+    sample = pd.Series(values).dropna().astype(str).head(sample_size)
+    if sample.empty or not sample.str.contains(r'\d', regex=True).all():
+        return []
+    return [
+        fmt for fmt in _formats(dayfirst)
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all()
+    ]
+
+
+def infer_date_format(values, sample_size=500, dayfirst=True):
+    """Return the first format in DATE_FORMATS that parses every sampled value, or None"""
+    candidates = date_format_candidates(values, sample_size, dayfirst)
+    return candidates[0] if candidates else None
+
+
+def parse_dates(series, formats):
+    """
+    (parsed, format) for the first of formats that parses every non-null value
+    of series, or (None, None) if each of them would turn some values into NaT.
+    """
+    nulls = series.isna().sum()
+    for fmt in formats:
+        parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+        if parsed.isna().sum() == nulls:
+            return parsed, fmt
+    return None, None
+
+
+class ParsedDateCache:
+    """
+    Parsed date columns, shared by every chart expression and rerun.
+
+    pd.to_datetime(df[col], ...) without a format falls back to slow
+    per-element parsing. Here the format is detected once from a sample
+    (honouring dayfirst), the column is parsed with it in one vectorized
+    pass, and the result is kept per (dataset fingerprint, column, options).
+    If the detected format leaves values unparsed that pandas' own parser
+    might handle, the plain pd.to_datetime call is used instead.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def to_datetime(self, df, col, **kwargs):
+        """Cached equivalent of pd.to_datetime(df[col], **kwargs)"""
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series) and not kwargs.get('utc'):
+            return series
+
+        key = (dataset_fingerprint(df), col, tuple(sorted(kwargs.items())))
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return parsed
+            self.misses += 1
+
+        parsed = self._parse(series, **kwargs)
+        with self._lock:
+            self._entries[key] = parsed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return parsed
+
+    @staticmethod
+    def _parse(series, **kwargs):
+        if kwargs.get('format') is None and _is_text(series):
+            fmt = infer_date_format(series, dayfirst=kwargs.get('dayfirst', False))
+            if fmt is not None:
+                options = {k: v for k, v in kwargs.items() if k not in ('dayfirst', 'yearfirst', 'errors', 'format')}
+                parsed = pd.to_datetime(series, format=fmt, errors='coerce', **options)
+                if parsed.isna().sum() == series.isna().sum():
+                    return parsed
+        return pd.to_datetime(series, **kwargs)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series) \
+        or isinstance(series.dtype, pd.CategoricalDtype)
+
+
+# Serves pd.to_datetime(df[col], ...) in chart expressions (see expression_engine)
+parsed_dates = ParsedDateCache()
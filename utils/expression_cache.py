@@ -0,0 +1,99 @@
+import ast
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=1024)
+def normalize_expression(expr):
+    """Canonical form of an expression so whitespace/quote style don't split cache entries"""
+    try:
+        return ast.unparse(ast.parse(expr.strip(), mode="eval"))
+    except SyntaxError:
+        return expr.strip()
+
+
+def _value_size(value):
+    """Approximate memory held by a cached value; arrays count their data buffer"""
+    if isinstance(value, np.ndarray):
+        size = value.nbytes
+        if value.dtype == object and len(value):
+            sample = value[:100]
+            size += sum(sys.getsizeof(item) for item in sample) * len(value) // len(sample)
+        return size
+    return sys.getsizeof(value)
+
+
+class ExpressionCache:
+    """
+    Bounded LRU cache of evaluated expression values.
+
+    Keys are (dataset fingerprint, normalized expression) and values are the
+    read-only arrays (or lists) spliced into chart specs. Module-level state
+    survives Streamlit reruns, so an unchanged spec skips pandas entirely.
+    The cache is shared by all sessions in the process and guarded by a lock.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, expr):
+        """Return the cached value or None"""
+        key = (fingerprint, normalize_expression(expr))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, fingerprint, expr):
+        """True if a value is cached, without counting a hit or miss"""
+        with self._lock:
+            return (fingerprint, normalize_expression(expr)) in self._entries
+
+    def put(self, fingerprint, expr, value):
+        """Store a value, evicting least recently used entries over the limits"""
+        key = (fingerprint, normalize_expression(expr))
+        size = _value_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Entry count, byte usage and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared by render_plotly_chart and render_echarts_chart
+expression_cache = ExpressionCache()
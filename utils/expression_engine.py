@@ -0,0 +1,384 @@
+import ast
+from collections import Counter
+from functools import lru_cache
+import pandas as pd
+from .dates import parsed_dates
+
+
+class ExpressionError(ValueError):
+    """Raised when a chart expression cannot be parsed or uses a disallowed operation"""
+
+
+# Attributes/methods an expression may use. Anything else (read_*, to_csv,
+# dunder access, ...) is rejected before the expression is ever executed.
+# query/eval are deliberately missing: their string argument runs through
+# pandas' own evaluator (with @-references to any Python object), out of
+# reach of this check.
+ALLOWED_ATTRIBUTES = frozenset({
+    # pandas top-level functions
+    'to_datetime', 'to_numeric', 'to_timedelta', 'cut', 'qcut', 'Grouper',
+    'Timestamp', 'Timedelta', 'Period', 'DateOffset', 'date_range', 'concat',
+    'crosstab', 'isna', 'isnull', 'notna', 'notnull', 'NaT', 'NA',
+    # selection and reshaping
+    'loc', 'iloc', 'head', 'tail', 'assign', 'sort_values', 'sort_index',
+    'reset_index', 'set_index', 'drop', 'dropna', 'fillna', 'rename', 'astype',
+    'isin', 'between', 'where', 'mask', 'nlargest', 'nsmallest',
+    'drop_duplicates', 'duplicated', 'unique', 'nunique', 'value_counts',
+    'groupby', 'resample', 'rolling', 'expanding', 'pivot_table', 'pivot',
+    'melt', 'stack', 'unstack', 'explode', 'transpose', 'T', 'get', 'filter',
+    'apply', 'map', 'agg', 'aggregate', 'transform', 'replace', 'copy',
+    # aggregations and numeric ops
+    'sum', 'mean', 'median', 'min', 'max', 'count', 'size', 'std', 'var',
+    'first', 'last', 'prod', 'idxmax', 'idxmin', 'mode', 'any', 'all',
+    'cumcount', 'cumsum', 'cumprod', 'cummax', 'cummin', 'diff', 'pct_change',
+    'shift', 'rank', 'corr', 'cov', 'describe', 'quantile', 'round', 'abs',
+    'clip', 'add', 'sub', 'mul', 'div', 'truediv', 'floordiv', 'mod', 'pow',
+    'eq', 'ne', 'lt', 'gt', 'le', 'ge',
+    # accessors
+    'dt', 'str', 'cat',
+    'year', 'month', 'day', 'quarter', 'isocalendar', 'week', 'dayofweek',
+    'day_of_week', 'weekday', 'dayofyear', 'day_of_year', 'day_name',
+    'month_name', 'hour', 'minute', 'date', 'to_period', 'to_timestamp',
+    'strftime', 'floor', 'ceil', 'normalize', 'start_time', 'end_time',
+    'lower', 'upper', 'strip', 'title', 'contains', 'startswith', 'endswith',
+    'split', 'len', 'slice', 'categories', 'codes',
+    # conversion
+    'tolist', 'to_list', 'values', 'index', 'columns', 'to_numpy', 'to_dict',
+    'name', 'dtype', 'shape',
+})
+
+# Builtins an expression may use, by name or as a call (.astype(str), .apply(len), len(df))
+SAFE_BUILTINS = {
+    'str': str, 'int': int, 'float': float, 'bool': bool, 'len': len,
+    'round': round, 'abs': abs, 'min': min, 'max': max, 'list': list,
+}
+
+ALLOWED_NAMES = frozenset({'df', 'pd', *SAFE_BUILTINS})
+
+ALLOWED_NODES = (
+    ast.Expression, ast.Call, ast.Attribute, ast.Subscript, ast.Name,
+    ast.Constant, ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp,
+    ast.List, ast.Tuple, ast.Dict, ast.Slice, ast.keyword, ast.Load,
+    ast.operator, ast.boolop, ast.cmpop, ast.unaryop, ast.IfExp,
+    # lambdas and comprehensions for .apply/.map/.agg; their names are local
+    ast.Lambda, ast.arguments, ast.arg, ast.ListComp, ast.DictComp,
+    ast.GeneratorExp, ast.comprehension, ast.Store,
+)
+
+# Placeholder name for a memoized prefix value (see SpecMemo)
+PREFIX_NAME = '_cse'
+
+
+def find_expressions(text):
+    """
+    Find (start, end) spans of df/pd expressions ending in .tolist() variants.
+
+    A single left-to-right pass: candidates open at a df/pd identifier followed
+    by '[', '.' or '(' outside JSON string literals and close at a .tolist()
+    back at their starting depth.
+    A candidate is abandoned as soon as it cannot be an expression any more
+    (a ',', ':' or '}' at its own depth, or a closing bracket below it), and
+    any complete expressions found inside it are kept instead.
+    """
+    spans = []
+    stack = []  # [start, base_depth, completed inner spans]
+    depth = 0
+    in_string = None
+    i = 0
+    n = len(text)
+
+    while i < n:
+        char = text[i]
+
+        # Skip string literals: JSON strings outside candidates (a "df." in a
+        # title is text), Python strings of either quote inside them
+        if in_string is not None:
+            if char == '\\':
+                i += 2
+                continue
+            if char == in_string:
+                in_string = None
+            i += 1
+            continue
+        if char == '"' or (stack and char == "'"):
+            in_string = char
+            i += 1
+            continue
+
+        # Start of a new candidate
+        if (
+            char in 'dp'
+            and text.startswith(('df', 'pd'), i)
+            and i + 2 < n and text[i+2] in '[.('
+            and (i == 0 or not (text[i-1].isalnum() or text[i-1] == '_'))
+        ):
+            stack.append([i, depth, []])
+            i += 2
+            continue
+
+        if not stack:
+            i += 1
+            continue
+
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+            # Abandon candidates whose enclosing bracket just closed
+            while stack and depth < stack[-1][1]:
+                _abandon(stack, spans)
+            if (
+                stack and depth == stack[-1][1] and char == ')'
+                and text.endswith('.tolist()', stack[-1][0], i + 1)
+                and (i + 1 >= n or text[i+1] not in '.([')
+            ):
+                start = stack.pop()[0]
+                (stack[-1][2] if stack else spans).append((start, i + 1))
+                if not stack:
+                    depth = 0
+        elif char in ',:}' and depth == stack[-1][1]:
+            while stack and depth == stack[-1][1]:
+                _abandon(stack, spans)
+
+        if not stack:
+            depth = 0
+        i += 1
+
+    while stack:
+        _abandon(stack, spans)
+
+    return spans
+
+
+def _abandon(stack, spans):
+    """Drop the innermost candidate, keeping any complete expressions inside it"""
+    inner = stack.pop()[2]
+    (stack[-1][2] if stack else spans).extend(inner)
+
+
+def _bound_names(node):
+    """Names a lambda or comprehension binds for its body"""
+    if isinstance(node, ast.Lambda):
+        args = node.args
+        return {a.arg for a in [*args.posonlyargs, *args.args, *args.kwonlyargs, args.vararg, args.kwarg] if a}
+    if isinstance(node, (ast.ListComp, ast.DictComp, ast.GeneratorExp)):
+        return {
+            name.id for gen in node.generators for name in ast.walk(gen.target)
+            if isinstance(name, ast.Name)
+        }
+    return set()
+
+
+def _validate(tree):
+    stack = [(tree, frozenset())]
+    while stack:
+        node, names = stack.pop()
+        if not isinstance(node, ALLOWED_NODES):
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in ALLOWED_NAMES and node.id not in names:
+            raise ExpressionError(f"Unknown name: {node.id}")
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_ATTRIBUTES:
+            raise ExpressionError(f"Operation not allowed: .{node.attr}")
+        if isinstance(node, ast.Call) and not (
+            isinstance(node.func, ast.Attribute)
+            or (isinstance(node.func, ast.Name) and node.func.id in SAFE_BUILTINS)
+        ):
+            raise ExpressionError("Only pandas methods and basic builtins can be called")
+        inner = names | _bound_names(node)
+        stack.extend((child, inner) for child in ast.iter_child_nodes(node))
+
+
+def _chain_nodes(node):
+    """Calls and subscripts along the method chain of node, outermost first"""
+    nodes = []
+    while True:
+        if isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, (ast.Attribute, ast.Subscript)):
+            node = node.value
+        else:
+            return nodes
+        if isinstance(node, (ast.Call, ast.Subscript)):
+            nodes.append(node)
+
+
+class _ReplaceNode(ast.NodeTransformer):
+    def __init__(self, target):
+        self.target = target
+
+    def visit(self, node):
+        if node is self.target:
+            return ast.copy_location(ast.Name(id=PREFIX_NAME, ctx=ast.Load()), node)
+        return super().visit(node)
+
+
+def _observed_counts(counts):
+    """Drop the zero rows value_counts() adds for unobserved categories"""
+    if isinstance(counts.index, pd.CategoricalIndex):
+        return counts[counts > 0]
+    return counts
+
+
+class _ObservedOnly(ast.NodeTransformer):
+    """
+    Make category columns group like plain strings.
+
+    load_csv stores low-cardinality text as category; without this a filtered
+    frame would still produce empty groups/counts for every category.
+    """
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Attribute):
+            return node
+        if node.func.attr in ('groupby', 'pivot_table'):
+            if not any(kw.arg == 'observed' for kw in node.keywords):
+                node.keywords.append(ast.keyword(arg='observed', value=ast.Constant(True)))
+        elif node.func.attr == 'value_counts':
+            return ast.Call(func=ast.Name(id='_observed_counts', ctx=ast.Load()), args=[node], keywords=[])
+        return node
+
+
+class _CachedDates(ast.NodeTransformer):
+    """
+    Serve pd.to_datetime(df["col"], <constant options>) from parsed_dates.
+
+    The column is parsed once per dataset with a detected explicit format,
+    however many expressions, specs and reruns ask for it.
+    """
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if not (isinstance(func, ast.Attribute) and func.attr == 'to_datetime'
+                and isinstance(func.value, ast.Name) and func.value.id == 'pd'
+                and len(node.args) == 1
+                and all(kw.arg and isinstance(kw.value, ast.Constant) for kw in node.keywords)):
+            return node
+        column = node.args[0]
+        if not (isinstance(column, ast.Subscript) and isinstance(column.value, ast.Name) and column.value.id == 'df'
+                and isinstance(column.slice, ast.Constant) and isinstance(column.slice.value, str)):
+            return node
+        return ast.Call(
+            func=ast.Name(id='_to_datetime', ctx=ast.Load()),
+            args=[column.value, column.slice],
+            keywords=node.keywords
+        )
+
+
+def _compile(tree):
+    tree = ast.fix_missing_locations(_ObservedOnly().visit(_CachedDates().visit(tree)))
+    return compile(tree, '<chart-expression>', 'eval')
+
+
+def _namespace(df, **extra):
+    return {
+        '__builtins__': SAFE_BUILTINS, 'df': df, 'pd': pd,
+        '_observed_counts': _observed_counts, '_to_datetime': parsed_dates.to_datetime, **extra
+    }
+
+
+class CompiledExpression:
+    """
+    A validated, compiled chart expression.
+
+    key is the normalized source (ast.unparse), so formatting differences
+    share one plan. prefixes lists the reusable chain prefixes (normalized
+    source of each call/subscript along the chain), longest first.
+    array_source is the expression without its final .tolist() (None if it
+    doesn't end in one), for callers that can use the array directly.
+    """
+
+    def __init__(self, source):
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression: {e.msg}") from None
+        _validate(tree)
+
+        self.source = source
+        self.key = ast.unparse(tree)
+        self.prefixes = [ast.unparse(node) for node in _chain_nodes(tree.body)]
+        body = tree.body
+        is_tolist = (
+            isinstance(body, ast.Call) and isinstance(body.func, ast.Attribute)
+            and body.func.attr == 'tolist' and not body.args and not body.keywords
+        )
+        self.array_source = ast.unparse(body.func.value) if is_tolist else None
+        self.code = _compile(tree)
+        self._remainders = {}
+
+    def evaluate(self, df):
+        return eval(self.code, _namespace(df))
+
+    def evaluate_from_prefix(self, prefix, value, df):
+        """Evaluate the rest of the chain on top of an already computed prefix value"""
+        code = self._remainders.get(prefix)
+        if code is None:
+            # Work on a fresh tree so the prefix node can be swapped out in place
+            tree = ast.parse(self.key, mode='eval')
+            target = next(node for node in _chain_nodes(tree.body) if ast.unparse(node) == prefix)
+            code = _compile(_ReplaceNode(target).visit(tree))
+            self._remainders[prefix] = code
+        return eval(code, _namespace(df, **{PREFIX_NAME: value}))
+
+
+@lru_cache(maxsize=2048)
+def compile_expression(source):
+    """Parse, validate and compile an expression once; raises ExpressionError"""
+    return CompiledExpression(source)
+
+
+class SpecMemo:
+    """
+    Memoizes expression values within a single spec.
+
+    Prefixes shared by two or more expressions (e.g. the same
+    df.assign(...).sort_values(...) chain used for both x and y) are
+    evaluated once and the rest of each chain is applied to the cached value.
+    With a rollup cube (see utils/rollup.py), groupby aggregations it can
+    answer are looked up instead of computed.
+    """
+
+    def __init__(self, df, expressions, rollup=None):
+        self.df = df
+        self.rollup = rollup
+        self.values = {}
+        self.saved = 0
+        self.rollup_hits = 0
+
+        counts = Counter(
+            prefix
+            for expr in {e.key: e for e in expressions}.values()
+            for prefix in expr.prefixes
+        )
+        self.shared = {prefix for prefix, count in counts.items() if count > 1}
+
+    def uses_rollup(self, expr):
+        """True if the rollup cube answers expr or a prefix of its chain"""
+        return self.rollup is not None and any(
+            self.rollup.can_answer(source) for source in [expr.key, *expr.prefixes]
+        )
+
+    def evaluate(self, expr):
+        """Evaluate a CompiledExpression, reusing any cached shared prefix or rollup answer"""
+        if expr.key in self.values:
+            self.saved += 1
+            return self.values[expr.key]
+
+        # The longest part of the chain that is either shared or answered by the cube wins
+        for source in [expr.key, *expr.prefixes]:
+            if source != expr.key and source in self.shared:
+                base = self.evaluate(compile_expression(source))
+                value = expr.evaluate_from_prefix(source, base, self.df)
+                break
+            series = self.rollup.answer(source) if self.rollup is not None else None
+            if series is not None:
+                self.rollup_hits += 1
+                value = series if source == expr.key else expr.evaluate_from_prefix(source, series, self.df)
+                break
+        else:
+            value = expr.evaluate(self.df)
+
+        self.values[expr.key] = value
+        return value
@@ -0,0 +1,271 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+import pandas as pd
+from .dataset_cache import dataset_cache
+from .expression_engine import SpecMemo, compile_expression
+from .fingerprint import assign_fingerprint
+
+
+# Worker processes evaluating chart expressions; 0 keeps evaluation in the script thread
+MAX_WORKERS = int(os.getenv("CHATBI_EXPR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Wall-clock seconds one spec's expressions may run before their worker is stopped
+EVALUATION_TIMEOUT = float(os.getenv("CHATBI_EXPR_TIMEOUT", "30"))
+# Private (not file-backed) memory an evaluation may add to its worker before the worker is stopped
+MEMORY_LIMIT = int(os.getenv("CHATBI_EXPR_MEMORY_MB", "2048")) * 1024 ** 2
+# Smaller datasets are evaluated in the script thread, where they finish before a worker would answer
+MIN_OFFLOAD_ROWS = int(os.getenv("CHATBI_EXPR_OFFLOAD_ROWS", "200000"))
+# Seconds between checks of a running evaluation (deadline, memory, cancellation)
+CHECK_INTERVAL = 0.1
+# Datasets each worker keeps loaded, as long as its private memory stays under WORKER_CACHE_MEMORY
+WORKER_DATASETS = 2
+WORKER_CACHE_MEMORY = int(os.getenv("CHATBI_EXPR_WORKER_CACHE_MB", "1024")) * 1024 ** 2
+
+
+class EvaluationAborted(RuntimeError):
+    """Raised when a worker evaluation is stopped; reason is "timeout", "memory" or "failed" """
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _worker_main(conn):
+    """
+    Worker process loop. ("load", fingerprint) answers whether the dataset
+    could be loaded from the disk cache; ("evaluate", sources) answers with
+    {key: ("ok", value) or ("error", message)} for the loaded dataset.
+
+    Datasets are read from the disk cache's memory-mapped Feather files.
+    Numeric and date columns without nulls stay views of the file, so their
+    pages are shared by every worker; text columns and columns with nulls
+    are private copies. Older datasets are dropped once the worker's private
+    memory exceeds WORKER_CACHE_MEMORY.
+    """
+    # Derived frames (assign, filters) reference the mapped columns instead of copying them
+    pd.set_option("mode.copy_on_write", True)
+    datasets = OrderedDict()
+    df = None
+    while True:
+        try:
+            command, argument = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        if command == "load":
+            df = datasets.get(argument)
+            if df is None:
+                loaded = dataset_cache.load(argument, zero_copy=True)
+                if loaded is not None:
+                    df = loaded[0]
+                    assign_fingerprint(df, argument)
+                    datasets[argument] = df
+                    while len(datasets) > 1 and (
+                        len(datasets) > WORKER_DATASETS or (_private_bytes(os.getpid()) or 0) > WORKER_CACHE_MEMORY
+                    ):
+                        datasets.popitem(last=False)
+            else:
+                datasets.move_to_end(argument)
+            conn.send(df is not None)
+            continue
+
+        expressions = [compile_expression(source) for source in argument]
+        memo = SpecMemo(df, expressions)
+        results = {}
+        for expr in expressions:
+            try:
+                results[expr.key] = ("ok", memo.evaluate(expr))
+            except Exception as e:
+                results[expr.key] = ("error", f"{type(e).__name__}: {e}")
+        conn.send(results)
+
+
+def _private_bytes(pid):
+    """
+    Resident memory of a process not backed by files (so not counting the
+    shared pages of mapped datasets) from /proc, or None where that isn't available
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), name="chatbi-expr", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def private_bytes(self):
+        return _private_bytes(self.process.pid)
+
+    def stop(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ExpressionWorkerPool:
+    """
+    Process pool for chart expressions on large datasets.
+
+    Evaluation runs in separate processes, so a slow expression neither
+    blocks the session's script thread on the GIL nor slows other sessions.
+    Each evaluation has a wall-clock timeout and a cap on the memory it adds
+    to its worker. Stopping a worker (timeout, memory, or the caller being
+    interrupted, e.g. by a Streamlit rerun when a new prompt is submitted)
+    kills the process and a fresh one is started on demand. Busy/waiting
+    workers, peak queue, outcome counters and wait/run times are tracked for
+    the sidebar.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, timeout=EVALUATION_TIMEOUT, memory_limit=MEMORY_LIMIT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        # Spawned, not forked: the Streamlit server process is multi-threaded
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1))
+        self._idle = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._waiting = 0
+        self.peak_waiting = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "memory_stops": 0, "cancelled": 0}
+        self._waits = deque(maxlen=200)
+        self._runs = deque(maxlen=200)
+
+    def accepts(self, df, fingerprint):
+        """True if df is worth sending to a worker and workers can load it from the disk cache"""
+        return self.max_workers > 0 and len(df) >= MIN_OFFLOAD_ROWS and dataset_cache.path_for(fingerprint) is not None
+
+    def _take_worker(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.stop()
+        return _Worker(self._context)
+
+    def _reply(self, worker, on_wait, started=None, baseline=None):
+        """
+        Wait for the worker's answer. With started, the evaluation timeout
+        and memory cap (over baseline) are enforced while waiting.
+        """
+        waiting_since = time.perf_counter()
+        while not worker.conn.poll(CHECK_INTERVAL):
+            if started is not None:
+                if time.perf_counter() - started > self.timeout:
+                    raise EvaluationAborted(
+                        "timeout", f"Chart expressions ran longer than {self.timeout:g}s and were stopped"
+                    )
+                private = worker.private_bytes()
+                if private is not None and baseline is not None and private - baseline > self.memory_limit:
+                    raise EvaluationAborted(
+                        "memory",
+                        f"Chart expressions needed more than {self.memory_limit / 1024 ** 2:,.0f} MB and were stopped"
+                    )
+            if on_wait is not None:
+                on_wait(time.perf_counter() - waiting_since)
+        return worker.conn.recv()
+
+    def evaluate(self, fingerprint, sources, on_wait=None):
+        """
+        Evaluate expression sources against the dataset with this fingerprint on a worker.
+
+        Returns {key: ("ok", value) or ("error", message)}, or None if the
+        worker could not load the dataset. Raises EvaluationAborted on a
+        timeout, the memory cap or a crashed worker. on_wait(elapsed) is
+        called every CHECK_INTERVAL while waiting; anything it raises stops
+        the worker and propagates.
+        """
+        enqueued = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+            self._counts["submitted"] += 1
+            self.peak_waiting = max(self.peak_waiting, self._waiting)
+        try:
+            while not self._slots.acquire(timeout=CHECK_INTERVAL):
+                if on_wait is not None:
+                    on_wait(time.perf_counter() - enqueued)
+        except BaseException:
+            with self._lock:
+                self._waiting -= 1
+                self._counts["cancelled"] += 1
+            raise
+
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting -= 1
+            self._busy += 1
+            self._waits.append(started - enqueued)
+
+        worker = None
+        finished = False
+        try:
+            worker = self._take_worker()
+            # Starting a worker and loading the dataset don't count against the budgets
+            worker.conn.send(("load", fingerprint))
+            results = None
+            if self._reply(worker, on_wait):
+                baseline = worker.private_bytes()
+                worker.conn.send(("evaluate", list(sources)))
+                results = self._reply(worker, on_wait, time.perf_counter(), baseline)
+            finished = True
+        except EvaluationAborted as e:
+            self._count("timeouts" if e.reason == "timeout" else "memory_stops")
+            raise
+        except (EOFError, OSError):
+            self._count("failed")
+            raise EvaluationAborted("failed", "The expression worker stopped unexpectedly") from None
+        except BaseException:
+            self._count("cancelled")
+            raise
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._runs.append(time.perf_counter() - started)
+                if finished:
+                    self._idle.append(worker)
+            if not finished and worker is not None:
+                worker.stop()
+            self._slots.release()
+
+        self._count("completed")
+        return results
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        """Busy/waiting workers, peak queue, outcome counters and wait/run p95 (seconds)"""
+        with self._lock:
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+            return {
+                "max_workers": self.max_workers,
+                "busy": self._busy,
+                "waiting": self._waiting,
+                "peak_waiting": self.peak_waiting,
+                **self._counts,
+                "wait_p95": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0,
+                "run_p95": runs[min(int(len(runs) * 0.95), len(runs) - 1)] if runs else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+# Shared by every session in the process
+expression_pool = ExpressionWorkerPool()
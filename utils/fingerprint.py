@@ -0,0 +1,39 @@
+import hashlib
+import pandas as pd
+
+
+FINGERPRINT_ATTR = "chatbi_fingerprint"
+
+
+def _shape_key(df):
+    return (df.shape, tuple(map(str, df.columns)))
+
+
+def assign_fingerprint(df, fingerprint):
+    """Use an already known content hash (e.g. of the uploaded file) as the fingerprint"""
+    df.attrs[FINGERPRINT_ATTR] = (_shape_key(df), fingerprint)
+    return fingerprint
+
+
+def dataset_fingerprint(df):
+    """
+    Return a stable content fingerprint for a DataFrame.
+
+    The hash covers column names, dtypes and every value, so it is computed
+    once and stored in df.attrs (which survives pickling and the per-session
+    views handed out by the dataset registry).
+    The stored value is only trusted while the shape and columns still match.
+    """
+    shape_key = _shape_key(df)
+    cached = df.attrs.get(FINGERPRINT_ATTR)
+    if cached and cached[0] == shape_key:
+        return cached[1]
+
+    hasher = hashlib.sha256()
+    hasher.update(repr(shape_key).encode())
+    hasher.update(df.dtypes.to_string().encode())
+    hasher.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    fingerprint = hasher.hexdigest()[:32]
+
+    df.attrs[FINGERPRINT_ATTR] = (shape_key, fingerprint)
+    return fingerprint
@@ -0,0 +1,200 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from .chat_handler import request_completion
+
+
+# Completions in flight per process; further requests wait in the queue
+MAX_CONCURRENT_CALLS = int(os.getenv("CHATBI_LLM_CONCURRENCY", "8"))
+# Seconds between checks of a pending reply
+POLL_INTERVAL = 0.5
+
+
+class LLMJobPool:
+    """
+    Process-wide thread pool for LLM requests.
+
+    Script threads submit a completion and return immediately instead of
+    blocking on network I/O; at most max_concurrency requests run at once
+    and the rest queue. Queue depth, peak and wait times are tracked for
+    the sidebar.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_CALLS):
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="chatbi-llm")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        self.peak_queue = 0
+        self._waits = deque(maxlen=200)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and return its Future"""
+        enqueued = time.perf_counter()
+
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._waits.append(time.perf_counter() - enqueued)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._counts["failed"] += 1
+                raise
+            else:
+                with self._lock:
+                    self._counts["completed"] += 1
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+            self._counts["submitted"] += 1
+            self.peak_queue = max(self.peak_queue, self._queued)
+        # Runs in a copy of the caller's context so the job's spans join the caller's trace
+        future = self._executor.submit(contextvars.copy_context().run, run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # A cancelled job never ran, so it is still counted as queued
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._counts["cancelled"] += 1
+
+    def stats(self):
+        """Running/queued jobs, peak queue depth, job counters and queue wait p50/p95 (seconds)"""
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "queued": self._queued,
+                "peak_queue": self.peak_queue,
+                **self._counts,
+                "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0,
+            }
+
+
+llm_jobs = LLMJobPool()
+
+
+class CompletionJob:
+    """
+    A request_completion call on the shared pool; text holds the reply
+    received so far and spec_text the reply up to its complete spec, set
+    while the rest is still streaming. perf_counter timestamps record when
+    it was submitted, started running and finished.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.spec_text = None
+        self.spec_taken = False
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def _run(self, *args, **kwargs):
+        self.started_at = time.perf_counter()
+        try:
+            return request_completion(*args, on_text=self._update, on_spec=self._spec_ready, **kwargs)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def _update(self, text):
+        self.text = text
+
+    def _spec_ready(self, text):
+        self.spec_text = text
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def cancel(self):
+        return self.future.cancel()
+
+
+def submit_completion(api_key, model, messages, pool=None, **kwargs):
+    """Start request_completion in the background and return its CompletionJob"""
+    job = CompletionJob()
+    job.future = (pool or llm_jobs).submit(job._run, api_key, model, messages, **kwargs)
+    return job
+
+
+def job_pending(key):
+    """True while the reply under st.session_state[key] is still being generated"""
+    job = st.session_state.get(key)
+    return job is not None and not job.done()
+
+
+def start_job(key, job):
+    """
+    Store job as the pending reply under st.session_state[key].
+
+    A chat has one reply in flight at a time, so every user turn gets its
+    assistant turn: the previous job must have been picked up by finished_job.
+    """
+    if st.session_state.get(key) is not None:
+        raise RuntimeError("The previous reply has not been picked up yet")
+    st.session_state[key] = job
+
+
+def finished_job(key):
+    """Remove and return the job under st.session_state[key] once it is done, else None"""
+    job = st.session_state.get(key)
+    if job is None or not job.done():
+        return None
+    del st.session_state[key]
+    return job
+
+
+def ready_spec(key):
+    """
+    The reply up to its complete spec for the job under st.session_state[key]
+    while the rest is still streaming, returned once per job; else None
+    """
+    job = st.session_state.get(key)
+    if job is None or job.spec_text is None or job.spec_taken:
+        return None
+    job.spec_taken = True
+    return job.spec_text
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def _pending_reply(key):
+    job = st.session_state.get(key)
+    if job is None:
+        return
+    if job.done() or (job.spec_text is not None and not job.spec_taken):
+        # The full rerun picks the reply up through finished_job, or the spec through ready_spec
+        st.rerun()
+    if job.text:
+        st.markdown(job.text)
+    elif job.started_at is not None:
+        st.markdown("⏳ Waiting for the model...")
+    else:
+        st.markdown(f"⏳ Queued ({llm_jobs.stats()['queued']} request(s) waiting)...")
+
+
+def render_pending(key):
+    """Show the partial reply of the pending job under st.session_state[key], refreshed until it finishes"""
+    if st.session_state.get(key) is not None:
+        with st.chat_message("assistant"):
+            _pending_reply(key)
@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import pandas as pd
+from .fingerprint import dataset_fingerprint
+from .context_budget import estimate_tokens
+from .data_loader import sample_info
+from .tracing import tracer
+from .prompts import STATIC_PROMPTS, get_vegalite_prompt, get_plotly_prompt, get_echarts_prompt
+
+
+MAX_PROFILES = 8
+
+
+@dataclass
+class ColumnProfile:
+    """Summary statistics for one column"""
+    name: str
+    dtype: str
+    kind: str  # numeric, categorical, date or other
+    nulls: int = 0
+    cardinality: int = 0
+    min: object = None
+    max: object = None
+
+    def describe(self):
+        """One line for the prompt, e.g. "- Sales (float64, min 10.5, max 990, 0 nulls)" """
+        parts = [self.dtype]
+        if self.kind == "categorical":
+            parts.append(f"{self.cardinality} distinct")
+        if self.kind == "date" and self.min is not None:
+            parts.append(f"{self.min:%Y-%m-%d} to {self.max:%Y-%m-%d}")
+        elif self.kind == "numeric" and self.min is not None:
+            parts.append(f"min {self.min:g}, max {self.max:g}")
+        parts.append(f"{self.nulls} nulls")
+        return f"- {self.name} ({', '.join(parts)})"
+
+
+def _column_profile(series):
+    if pd.api.types.is_bool_dtype(series):
+        kind = "other"
+    elif pd.api.types.is_numeric_dtype(series):
+        kind = "numeric"
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        kind = "date"
+    elif (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+          or isinstance(series.dtype, pd.CategoricalDtype)):
+        kind = "categorical"
+    else:
+        kind = "other"
+
+    profile = ColumnProfile(
+        name=str(series.name),
+        dtype=str(series.dtype),
+        kind=kind,
+        nulls=int(series.isna().sum()),
+        cardinality=int(series.nunique()),
+    )
+    if kind in ("numeric", "date") and profile.nulls < len(series):
+        profile.min, profile.max = series.min(), series.max()
+        if kind == "numeric":
+            profile.min, profile.max = float(profile.min), float(profile.max)
+    return profile
+
+
+@dataclass
+class DatasetProfile:
+    """
+    Everything the prompts need to know about a dataset, computed once.
+
+    Holds per-column dtypes, null counts, cardinalities and ranges, the
+    numeric/categorical/date column lists and the rendered dataset_info text.
+    System prompts are built on first use and memoized per chart library.
+    """
+    fingerprint: str
+    rows: int
+    columns: list
+    column_profiles: dict
+    numeric_cols: list
+    categorical_cols: list
+    date_cols: list
+    dataset_info: str
+    _prompts: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dataframe(cls, df, fingerprint=None):
+        # Same column classification as the original get_dataset_info
+        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
+        date_cols = df.select_dtypes(include=['datetime', 'datetimetz']).columns.tolist()
+        column_profiles = {col: _column_profile(df[col]) for col in df.columns}
+
+        date_info = ""
+        if date_cols:
+            date_info = (
+                f"Date columns (already parsed as datetime, use df[col].dt directly - "
+                f"no pd.to_datetime needed): {', '.join(date_cols)}\n"
+            )
+        column_summary = "\n".join(profile.describe() for profile in column_profiles.values())
+
+        sample = sample_info(df)
+        rows = sample["rows"] if sample else len(df)
+        sample_note = ""
+        if sample:
+            sample_note = (
+                f"Rows in df: {len(df)} ({sample['mode']} sample of the file; the column summary describes "
+                f"the sample). Single-column groupby sum/mean/count/min/max/size results are exact over all "
+                f"records; anything else (filters, other aggregations) is computed on the sample.\n"
+            )
+
+        dataset_info = f"""
+Dataset Information:
+Total Records: {rows}
+{sample_note}Columns: {', '.join(df.columns)}
+
+Numeric columns: {', '.join(numeric_cols)}
+Categorical columns: {', '.join(categorical_cols)}
+{date_info}
+Column summary:
+{column_summary}
+
+Sample data (first 3 rows):
+{df.head(3).to_string()}
+
+Data types:
+{df.dtypes.to_string()}
+"""
+        return cls(
+            fingerprint=fingerprint or dataset_fingerprint(df),
+            rows=rows,
+            columns=df.columns.tolist(),
+            column_profiles=column_profiles,
+            numeric_cols=numeric_cols,
+            categorical_cols=categorical_cols,
+            date_cols=date_cols,
+            dataset_info=dataset_info,
+        )
+
+    def system_prompt(self, library):
+        """System prompt for "vegalite", "plotly" or "echarts", built once per profile"""
+        prompt = self._prompts.get(library)
+        if prompt is None:
+            if library == "vegalite":
+                prompt = get_vegalite_prompt(self.dataset_info, self.numeric_cols, self.categorical_cols)
+            elif library == "plotly":
+                prompt = get_plotly_prompt(
+                    self.dataset_info, self.columns, self.numeric_cols, self.categorical_cols, self.date_cols
+                )
+            elif library == "echarts":
+                prompt = get_echarts_prompt(
+                    self.dataset_info, self.columns, self.numeric_cols, self.categorical_cols, self.date_cols
+                )
+            else:
+                raise ValueError(f"Unknown chart library: {library}")
+            self._prompts[library] = prompt
+        return prompt
+
+    def prompt_tokens(self, library):
+        """Estimated tokens of the system prompt and of its cacheable static prefix"""
+        return {
+            "system": estimate_tokens(self.system_prompt(library)),
+            "static_prefix": estimate_tokens(STATIC_PROMPTS[library]),
+        }
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def get_dataset_profile(df):
+    """Return the DatasetProfile for df, shared by all tabs and sessions via its fingerprint"""
+    fingerprint = dataset_fingerprint(df)
+    with _profiles_lock:
+        profile = _profiles.get(fingerprint)
+        if profile is not None:
+            _profiles.move_to_end(fingerprint)
+            return profile
+
+    with tracer.span("profile_dataset", rows=len(df), columns=len(df.columns)):
+        profile = DatasetProfile.from_dataframe(df, fingerprint)
+    with _profiles_lock:
+        _profiles[fingerprint] = profile
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+    return profile
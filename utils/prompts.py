@@ -1,17 +1,24 @@
 # Deprecated: Use prompts module instead
 from prompts import vegalite_prompt, plotly_prompt, echarts_prompt
 
+# Dataset-independent prompt prefix per chart library
+STATIC_PROMPTS = {
+    "vegalite": vegalite_prompt.STATIC_PROMPT,
+    "plotly": plotly_prompt.STATIC_PROMPT,
+    "echarts": echarts_prompt.STATIC_PROMPT,
+}
+
 
 def get_vegalite_prompt(dataset_info, numeric_cols, categorical_cols):
     """System prompt for Vega-Lite spec generation"""
     return vegalite_prompt.get_system_prompt(dataset_info, numeric_cols, categorical_cols)
 
 
-def get_plotly_prompt(dataset_info, columns, numeric_cols, categorical_cols):
+def get_plotly_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols=None):
     """System prompt for Plotly spec generation"""
-    return plotly_prompt.get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols)
+    return plotly_prompt.get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols)
 
 
-def get_echarts_prompt(dataset_info, columns, numeric_cols, categorical_cols):
+def get_echarts_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols=None):
     """System prompt for ECharts option generation"""
-    return echarts_prompt.get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols)
+    return echarts_prompt.get_system_prompt(dataset_info, columns, numeric_cols, categorical_cols, date_cols)
@@ -1,137 +1,683 @@
+import datetime
 import json
+import logging
+import numpy as np
 import streamlit as st
 import pandas as pd
-import re
+from .data_loader import sample_info
+from .expression_cache import expression_cache
+from .expression_engine import ExpressionError, SpecMemo, compile_expression, find_expressions
+from .expression_pool import expression_pool
+from .fingerprint import dataset_fingerprint
+from .rollup import get_rollup_cube
+from .tracing import tracer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def evaluate_python_expressions(spec_json, df):
+
+logger = logging.getLogger(__name__)
+
+# Categorical traces (bar/pie/funnel) with more points than this are aggregated
+MAX_CATEGORICAL_POINTS = 5_000
+# Categories kept after aggregation; the smallest ones are merged into "Other"
+MAX_CATEGORIES = 200
+# Default number of points kept per line/scatter trace (sidebar "max_chart_points")
+MAX_LINE_POINTS = 2_000
+
+# Stands in for an evaluated expression while the rest of the spec is parsed
+_PLACEHOLDER = "\u0000chatbi-expr:{}"
+
+
+def _json_default(value):
+    """Serialize values json can't (arrays, timestamps, periods, numpy scalars, NA)"""
+    if isinstance(value, np.ndarray):
+        return _to_list(value)
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        ts = pd.Timestamp(value)
+        return ts.strftime('%Y-%m-%d') if ts == ts.normalize() else ts.isoformat()
+    if isinstance(value, pd.Period):
+        return str(value)
+    if isinstance(value, (tuple, list)):
+        # MultiIndex labels; json writes them as nested arrays
+        return [item if item is None or isinstance(item, (str, int, float, bool)) else _json_default(item) for item in value]
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _format_dates(array):
+    """Strings for a datetime64 array in one pass, formatted as by _json_default (NaT as None)"""
+    text = np.full(len(array), None, dtype=object)
+    days = array.astype('datetime64[D]')
+    # Dates alone at midnight, otherwise seconds, microseconds or nanoseconds as Timestamp.isoformat() does
+    rest = ~np.isnat(array)
+    for unit in ('D', 's', 'us', 'ns'):
+        exact = rest & (array.astype(f'datetime64[{unit}]') == array)
+        if exact.any():
+            text[exact] = np.datetime_as_string(array[exact], unit=unit)
+        rest &= ~exact
+    return text.tolist()
+
+
+def _to_list(array):
+    """JSON-ready list for an evaluated array, with dates formatted as by _json_default"""
+    if array.dtype.kind == 'M':
+        return _format_dates(array)
+    values = array.tolist()
+    if array.dtype.kind in 'biuf':
+        return values
+    return [
+        value if value is None or isinstance(value, (str, int, float, bool)) else _json_default(value)
+        for value in values
+    ]
+
+
+def _json_ready(node, keep_numeric=False):
     """
-    Flexibly evaluate ANY Python expression containing df or pd in JSON.
-    Works with complex operations like filtering, date parsing, groupby, etc.
+    Copy of a spec with only JSON types left: arrays become lists (numeric ones
+    kept with keep_numeric), dates, periods and tuples as in _json_default.
+    """
+    if isinstance(node, dict):
+        return {key: _json_ready(value, keep_numeric) for key, value in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_json_ready(value, keep_numeric) for value in node]
+    if isinstance(node, np.ndarray):
+        return node if keep_numeric and node.dtype.kind in 'biuf' else _to_list(node)
+    if node is None or isinstance(node, (str, int, float, bool)):
+        return node
+    return _json_default(node)
 
-    Uses regex to find expression boundaries and a tokenizer for proper nesting.
-    """
-
-    def scan_for_tolist_end(text, start_pos):
-        """
-        Scan forward from start_pos to find the end of expression ending with .tolist() variants.
-        Properly tracks nesting to handle expressions like:
-        df[pd.to_datetime(...).dt.period() == ...].groupby(...).count().index.tolist()
-
-        The start_pos should point to the start of the df/pd identifier.
-        We track depth RELATIVE to that starting point.
-        """
-        i = start_pos
-        paren_depth = 0
-        bracket_depth = 0
-        in_string = None
-        started = False  # Track if we've opened any brackets/parens
-
-        while i < len(text):
-            char = text[i]
-
-            # Handle string literals (skip escaped quotes)
-            if char in ('"', "'") and (i == 0 or text[i-1] != '\\'):
-                if in_string is None:
-                    in_string = char
-                elif in_string == char:
-                    in_string = None
-                i += 1
-                continue
 
-            # Only process syntax outside of strings
-            if in_string is None:
-                # Track bracket/paren depth
-                if char == '(':
-                    paren_depth += 1
-                    started = True
-                elif char == ')':
-                    paren_depth -= 1
-                elif char == '[':
-                    bracket_depth += 1
-                    started = True
-                elif char == ']':
-                    bracket_depth -= 1
-
-                # Once we've started tracking AND we're back to depth 0, look for .tolist() endings
-                if started and paren_depth == 0 and bracket_depth == 0:
-                    # Check all variants of tolist endings (check longest first to avoid partial matches)
-                    if i >= 15 and text[i-15:i+1] == '.values.tolist()':
-                        # Verify no chaining continues after this
-                        if i + 1 >= len(text) or text[i+1] not in '.([':
-                            return i + 1
-                    elif i >= 14 and text[i-14:i+1] == '.index.tolist()':
-                        if i + 1 >= len(text) or text[i+1] not in '.([':
-                            return i + 1
-                    elif i >= 8 and text[i-8:i+1] == '.tolist()':
-                        if i + 1 >= len(text) or text[i+1] not in '.([':
-                            return i + 1
-
-            i += 1
-
-        return -1
-
-    # Use regex to find all potential df/pd expression starts
-    pattern = r'\b(df|pd)[\[\.\(]'
+def dumps(obj):
+    """JSON text for a spec holding NumPy arrays (orjson with native NumPy support when installed)"""
+    # orjson encodes numeric arrays natively; dates are formatted like _json_default
+    obj = _json_ready(obj, keep_numeric=orjson is not None)
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+    return json.dumps(obj, default=_json_default)
+
+
+def _as_array(value):
+    """Read-only 1-D NumPy array for array-likes; plain lists for anything else"""
+    if isinstance(value, pd.MultiIndex):
+        # Tuples of labels, serialized as nested arrays
+        return value.tolist()
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray, pd.api.extensions.ExtensionArray)):
+        array = np.asarray(value)
+        if array.ndim == 1:
+            # May be a view of the DataFrame; cached and shared, so never written to
+            array = array.view()
+            array.flags.writeable = False
+            return array
+        return array.tolist()
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def _splice(node, values):
+    """Swap placeholders in a parsed spec for their evaluated values, in place"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            node[key] = _splice(value, values)
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            node[i] = _splice(value, values)
+    elif isinstance(node, str) and node in values:
+        return values[node]
+    return node
+
+
+def _evaluate_on_workers(df, fingerprint, expressions, memo, cache, workers):
+    """
+    Send the expressions the cache and the rollup cube can't answer to a worker process as one batch.
+
+    Returns {key: ("ok", value) or ("error", message)} for them; empty when
+    df is evaluated in the script thread instead.
+    """
+    if workers is None or not workers.accepts(df, fingerprint):
+        return {}
+    pending = sorted({
+        expr.key for expr in expressions
+        if not (cache is not None and cache.contains(fingerprint, expr.key)) and not memo.uses_rollup(expr)
+    })
+    if not pending:
+        return {}
+
+    status = st.empty()
+    shown = []
+
+    def on_wait(elapsed):
+        # Every update is also where Streamlit stops this run when a new prompt is submitted
+        if int(elapsed) not in shown:
+            shown.append(int(elapsed))
+            status.caption(f"⏳ Evaluating {len(pending)} chart expression(s) in a worker process... {elapsed:.0f}s")
+
+    with tracer.span("evaluate_on_worker", expressions=len(pending), rows=len(df)) as span:
+        try:
+            results = workers.evaluate(fingerprint, pending, on_wait=on_wait)
+        finally:
+            status.empty()
+        span.set(loaded=results is not None)
+    return results or {}
+
+
+def _evaluate_expressions(spec_json, df, stats, cache, rollup, workers):
+    """
+    Evaluate every expression in spec_json.
+
+    Returns the text with each evaluated expression replaced by a quoted
+    placeholder, and a dict mapping placeholders to values.
+    """
+    spans = find_expressions(spec_json)
+
+    compiled = {}
+    for start, end in spans:
+        try:
+            expr = compile_expression(spec_json[start:end])
+            compiled[start] = compile_expression(expr.array_source) if expr.array_source else expr
+        except ExpressionError:
+            # Not a valid/allowed expression - it is left as is
+            pass
+
+    # Only a cube built at upload is used; building one here would cost more than it saves
+    memo = SpecMemo(df, compiled.values(), get_rollup_cube(df, build=False) if rollup else None)
+    fingerprint = dataset_fingerprint(df) if cache is not None or workers is not None else None
+    remote = _evaluate_on_workers(df, fingerprint, compiled.values(), memo, cache, workers)
+    cache_hits = 0
 
     result = []
+    values = {}
     last_end = 0
 
-    for match in re.finditer(pattern, spec_json):
-        start = match.start()
+    for start, end in spans:
+        # Copy everything before this expression
+        result.append(spec_json[last_end:start])
+        last_end = end
+
+        expr = compiled.get(start)
+        value = None
+
+        if expr is not None:
+            with tracer.span("evaluate_expression", expression=expr.key[:200], rows=len(df)) as span:
+                # Reuse the value from a previous rerun if the data hasn't changed
+                value = cache.get(fingerprint, expr.key) if cache is not None else None
+                span.set(cached=value is not None)
+                if value is not None:
+                    cache_hits += 1
+                else:
+                    try:
+                        if expr.key in remote:
+                            outcome, value = remote[expr.key]
+                            span.set(worker=True)
+                            if outcome == "error":
+                                span.error, value = value, None
+                            else:
+                                value = _as_array(value)
+                        else:
+                            rollup_hits = memo.rollup_hits
+                            value = _as_array(memo.evaluate(expr))
+                            span.set(rollup=memo.rollup_hits > rollup_hits)
+                        if cache is not None and value is not None:
+                            cache.put(fingerprint, expr.key, value)
+                    except Exception as e:
+                        # Evaluation failed - keep original
+                        span.error = f"{type(e).__name__}: {e}"
+                        value = None
+                if value is not None:
+                    span.set(result_len=len(value) if hasattr(value, "__len__") else 1)
+
+        if value is None:
+            result.append(spec_json[start:end])
+        else:
+            placeholder = _PLACEHOLDER.format(len(values))
+            values[placeholder] = value
+            result.append(json.dumps(placeholder))
+
+    # Copy any remaining text
+    result.append(spec_json[last_end:])
+
+    if stats is not None:
+        stats["expressions"] = len(spans)
+        stats["evaluations_saved"] = memo.saved
+        stats["cache_hits"] = cache_hits
+        stats["rollup_hits"] = memo.rollup_hits
+        stats["worker_evaluations"] = len(remote)
+        sample = sample_info(df)
+        if sample:
+            # Groupby aggregations the rollup answers are exact; everything else only saw the sample
+            sampled = sum(not memo.uses_rollup(expr) for expr in compiled.values())
+            stats["sampled"] = (sampled, len(df), sample["rows"], sample["mode"])
+
+    return ''.join(result), values
+
+
+def evaluate_spec(spec_json, df, stats=None, cache=expression_cache, rollup=True, workers=expression_pool):
+    """
+    Parse a spec and evaluate every Python expression containing df or pd in it.
+    Works with complex operations like filtering, date parsing, groupby, etc.
+
+    Expressions are located with a single tokenizer pass, then parsed,
+    checked against an allowlist of pandas operations and compiled once
+    (see utils/expression_engine.py). Sub-expressions shared across the spec
+    are computed once (see SpecMemo); pass a dict as stats to receive the
+    number of evaluations saved.
+
+    Each expression is replaced by a placeholder string, the spec is parsed
+    once, and the evaluated values are spliced into the parsed object. A
+    trailing .tolist() is skipped so results stay (read-only) NumPy arrays
+    rather than lists of Python objects. Values are also kept in a
+    cross-rerun cache keyed by the dataset fingerprint; pass cache=None to
+    bypass it. Groupby aggregations are answered from the dataset's rollup
+    cube when one has been built (see utils/rollup.py); pass rollup=False to
+    always scan the rows. On large datasets the remaining expressions run on
+    a worker process with a timeout and memory cap (see
+    utils/expression_pool.py); pass workers=None to evaluate them in the
+    calling thread. Raises ValueError if the spec is not valid JSON
+    afterwards, and EvaluationAborted if a worker was stopped.
+    """
+    text, values = _evaluate_expressions(spec_json, df, stats, cache, rollup, workers)
+    spec = orjson.loads(text) if orjson is not None else json.loads(text)
+    return _splice(spec, values)
+
+
+def evaluate_python_expressions(spec_json, df, stats=None, cache=expression_cache, rollup=True,
+                                workers=expression_pool):
+    """Evaluate the expressions in a spec and return it as JSON text (see evaluate_spec)"""
+    text, values = _evaluate_expressions(spec_json, df, stats, cache, rollup, workers)
+    try:
+        spec = orjson.loads(text) if orjson is not None else json.loads(text)
+    except ValueError:
+        # Not valid JSON as a whole - splice the values into the text instead
+        for placeholder, value in values.items():
+            text = text.replace(json.dumps(placeholder), dumps(value), 1)
+        return text
+    return dumps(_splice(spec, values))
+
+
+def _payload_size(obj):
+    return len(dumps(obj))
+
+
+def _payload_estimate(node):
+    """Approximate size of a spec in bytes without serializing it (array buffers plus text of the rest)"""
+    if isinstance(node, dict):
+        return sum(len(str(key)) + _payload_estimate(value) for key, value in node.items())
+    if isinstance(node, (list, tuple)):
+        return sum(_payload_estimate(value) for value in node)
+    if isinstance(node, np.ndarray):
+        return node.nbytes
+    return len(str(node))
+
+
+def _aggregate(labels, columns, max_categories=MAX_CATEGORIES):
+    """
+    Sum each column of values per label, keeping first-appearance order.
+
+    columns maps a name to a value list (None counts rows). Beyond
+    max_categories the largest categories are kept and the rest summed
+    into "Other". Returns (labels, {name: values}).
+    """
+    frame = pd.DataFrame({
+        name: np.ones(len(labels)) if values is None else pd.to_numeric(pd.Series(values), errors='coerce').to_numpy()
+        for name, values in columns.items()
+    })
+    grouped = frame.groupby(pd.Series(labels).to_numpy(), sort=False).sum()
+
+    if len(grouped) > max_categories:
+        order = grouped.sum(axis=1).sort_values(ascending=False).index
+        other = grouped.loc[order[max_categories - 1:]].sum().to_frame("Other").T
+        grouped = pd.concat([grouped.loc[order[:max_categories - 1]], other])
+
+    return grouped.index.tolist(), {name: grouped[name].tolist() for name in grouped.columns}
+
+
+def _is_array(value):
+    return isinstance(value, (list, np.ndarray))
+
+
+def _is_flat(values):
+    """True for evaluated arrays and lists of plain values (not [x, y] pairs or {name, value} items)"""
+    return isinstance(values, np.ndarray) or not any(isinstance(item, (dict, list)) for item in values)
+
 
-        # Skip if this match is within an already-processed region
-        if start < last_end:
+def _drop_point_arrays(container, length, keep):
+    """Remove per-point arrays (text, colors, customdata, ...) that no longer line up"""
+    for key in [k for k, v in container.items() if k not in keep and _is_array(v) and len(v) == length]:
+        del container[key]
+
+
+def _log_aggregation(name, points, categories, size_before, size_after, stats):
+    logger.info(
+        "Aggregated %s: %d points -> %d categories, %d -> %d bytes",
+        name, points, categories, size_before, size_after
+    )
+    stats.setdefault("aggregated", []).append((name, points, categories, size_before, size_after))
+
+
+def _aggregate_plotly(spec, stats, max_points=MAX_CATEGORICAL_POINTS):
+    """Group raw rows in bar/pie/funnel traces into one point per category"""
+    for index, trace in enumerate(spec.get("data", [])):
+        kind = trace.get("type", "scatter")
+        if kind == "pie":
+            label_key, value_key = "labels", "values"
+        elif kind in ("bar", "funnel"):
+            horizontal = trace.get("orientation", "h" if kind == "funnel" else "v") == "h"
+            label_key, value_key = ("y", "x") if horizontal else ("x", "y")
+        else:
             continue
 
-        # Copy everything before this match
-        result.append(spec_json[last_end:start])
+        labels = trace.get(label_key)
+        values = trace.get(value_key)
+        if not _is_array(labels) or len(labels) <= max_points:
+            continue
+        if values is not None and (not _is_array(values) or len(values) != len(labels)):
+            continue
+
+        size_before = _payload_size(trace)
+        trace[label_key], grouped = _aggregate(labels, {value_key: values})
+        trace[value_key] = grouped[value_key]
+        _drop_point_arrays(trace, len(labels), keep=(label_key, value_key))
+        if isinstance(trace.get("marker"), dict):
+            _drop_point_arrays(trace["marker"], len(labels), keep=())
+
+        _log_aggregation(
+            f"{kind} trace {trace.get('name', index)!r}", len(labels), len(trace[label_key]),
+            size_before, _payload_size(trace), stats
+        )
 
-        # Try to find the end of this expression
-        expr_end = scan_for_tolist_end(spec_json, start)
 
-        if expr_end != -1:
-            expr = spec_json[start:expr_end]
+def _axes(option, key):
+    axes = option.get(key)
+    return axes if isinstance(axes, list) else [axes] if isinstance(axes, dict) else []
+
+
+def _series_list(option):
+    series = option.get("series")
+    return series if isinstance(series, list) else [series] if isinstance(series, dict) else []
+
+
+def _aggregate_echarts(option, stats, max_points=MAX_CATEGORICAL_POINTS):
+    """Group raw rows in pie/funnel series and bar series on a category axis"""
+    series_list = _series_list(option)
+
+    for index, series in enumerate(series_list):
+        data = series.get("data")
+        if series.get("type") not in ("pie", "funnel") or not isinstance(data, list) or len(data) <= max_points:
+            continue
+        if not all(isinstance(item, dict) and "name" in item for item in data):
+            continue
+
+        size_before = _payload_size(series)
+        names, grouped = _aggregate([item["name"] for item in data], {"value": [item.get("value") for item in data]})
+        series["data"] = [{"name": name, "value": value} for name, value in zip(names, grouped["value"])]
+        _log_aggregation(
+            f"{series['type']} series {series.get('name', index)!r}", len(data), len(names),
+            size_before, _payload_size(series), stats
+        )
 
-            # Try to evaluate
-            try:
-                value = eval(expr, {"df": df, "pd": pd})
-                # Successfully evaluated - replace with the value
-                result.append(json.dumps(value))
-                last_end = expr_end
+    # Bar series share the labels of their category axis, so they are grouped together
+    for axis_key, index_key in (("xAxis", "xAxisIndex"), ("yAxis", "yAxisIndex")):
+        for axis_index, axis in enumerate(_axes(option, axis_key)):
+            labels = axis.get("data")
+            if not _is_array(labels) or len(labels) <= max_points:
+                continue
+            attached = [s for s in series_list if s.get(index_key, 0) == axis_index]
+            if not attached or not all(
+                s.get("type") == "bar" and _is_array(s.get("data")) and len(s["data"]) == len(labels)
+                and _is_flat(s["data"])
+                for s in attached
+            ):
                 continue
-            except Exception as e:
-                # Evaluation failed - keep original
-                pass
 
-        # If we couldn't evaluate, just copy the match itself
-        result.append(spec_json[start:match.end()])
-        last_end = match.end()
+            size_before = _payload_size(axis) + sum(_payload_size(s) for s in attached)
+            axis["data"], grouped = _aggregate(labels, {i: s["data"] for i, s in enumerate(attached)})
+            for i, s in enumerate(attached):
+                s["data"] = grouped[i]
+            _log_aggregation(
+                f"{len(attached)} bar series on {axis_key}[{axis_index}]", len(labels), len(axis["data"]),
+                size_before, _payload_size(axis) + sum(_payload_size(s) for s in attached), stats
+            )
 
-    # Copy any remaining text
-    result.append(spec_json[last_end:])
 
-    return ''.join(result)
+def lttb_indices(x, y, target):
+    """
+    Largest-Triangle-Three-Buckets: indices of target points that keep the shape of a line.
+
+    x must be increasing. The first and last points are always kept; every
+    bucket in between keeps the point forming the largest triangle with the
+    previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if target >= n or target < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
 
+    indices = np.empty(target, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for k in range(target - 2):
+        lo, hi = edges[k], edges[k + 1]
+        if k + 1 < target - 2:
+            cx, cy = avg_x[k + 1], avg_y[k + 1]
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        indices[k + 1] = a
+    return indices
 
-def render_plotly_chart(spec_json, df):
-    """Render Plotly chart from JSON spec"""
-    import plotly.graph_objects as go
 
-    # Evaluate all Python expressions in the JSON
-    processed_json = evaluate_python_expressions(spec_json, df)
+def minmax_indices(x, y, target):
+    """
+    Per-pixel min/max decimation: split the x range into target/2 buckets and
+    keep the lowest and highest point of each. x need not be sorted; the
+    kept indices are returned in their original order.
+    """
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(valid) <= target:
+        return valid
+    xv, yv = x[valid], y[valid]
+    buckets = max(target // 2, 1)
+    span = xv.max() - xv.min()
+    bucket = np.minimum(((xv - xv.min()) / span * buckets).astype(np.int64), buckets - 1) if span else np.zeros(len(xv), np.int64)
 
-    spec = json.loads(processed_json)
-    fig = go.Figure(spec)
-    st.plotly_chart(fig, use_container_width=True)
+    order = np.lexsort((yv, bucket))
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket[order]) != 0])
+    ends = np.r_[starts[1:], len(order)] - 1
+    return np.unique(valid[np.r_[order[starts], order[ends]]])
 
 
-def render_echarts_chart(spec_json, df):
-    """Render ECharts chart from JSON option"""
-    from streamlit_echarts import st_echarts
+def _numeric_axis(values):
+    """x values as floats: numbers as is, ISO dates as nanoseconds, anything else by position"""
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=float)
+    dates = pd.to_datetime(series, format="ISO8601", errors='coerce')
+    if dates.notna().all():
+        return dates.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    return np.arange(len(series), dtype=float)
+
+
+def _decimate(x_values, y_values, target, lines):
+    """
+    Pick the indices to keep for a large x/y trace, or None if nothing needs to go.
+
+    Lines use LTTB along their drawing order (x by position when it isn't
+    increasing); markers use min/max buckets over the x range.
+    """
+    if len(y_values) <= target:
+        return None, None
+    y = pd.to_numeric(pd.Series(y_values), errors='coerce').to_numpy(dtype=float)
+    if np.isnan(y).all():
+        return None, None
+    x = _numeric_axis(x_values) if x_values is not None else np.arange(len(y), dtype=float)
 
-    # Evaluate all Python expressions in the JSON
-    processed_json = evaluate_python_expressions(spec_json, df)
+    if lines:
+        if not (np.diff(x) >= 0).all():
+            x = np.arange(len(y), dtype=float)
+        return lttb_indices(x, np.nan_to_num(y, nan=np.nanmean(y)), target), "lttb"
+    return minmax_indices(x, y, target), "minmax"
+
+
+def _subset(values, indices):
+    return values[indices] if isinstance(values, np.ndarray) else [values[i] for i in indices]
+
+
+def _take(container, length, indices, skip=()):
+    """Subset every list of the given length in container (x, y, text, colors, ...)"""
+    for key, value in container.items():
+        if key not in skip and _is_array(value) and len(value) == length:
+            container[key] = _subset(value, indices)
+
+
+def _log_decimation(name, method, points, kept, stats):
+    logger.info("Decimated %s with %s: %d -> %d points", name, method, points, kept)
+    stats.setdefault("decimated", []).append((name, method, points, kept))
+
+
+def _downsample_plotly(spec, stats, target=MAX_LINE_POINTS):
+    """Decimate large scatter/scattergl traces and note it in each trace's meta"""
+    for index, trace in enumerate(spec.get("data", [])):
+        if trace.get("type", "scatter") not in ("scatter", "scattergl"):
+            continue
+        y = trace.get("y")
+        x = trace.get("x")
+        if not _is_array(y) or (x is not None and (not _is_array(x) or len(x) != len(y))):
+            continue
+
+        mode = trace.get("mode", "lines+markers" if len(y) < 20 else "lines")
+        indices, method = _decimate(x, y, target, lines="lines" in mode)
+        if indices is None:
+            continue
+
+        points = len(y)
+        _take(trace, points, indices)
+        if isinstance(trace.get("marker"), dict):
+            _take(trace["marker"], points, indices)
+        if trace.get("meta") is None or isinstance(trace["meta"], dict):
+            trace["meta"] = {**(trace.get("meta") or {}), "decimation": {"method": method, "points": points, "kept": len(indices)}}
+        _log_decimation(f"{trace.get('type', 'scatter')} trace {trace.get('name', index)!r}", method, points, len(indices), stats)
+
+
+def _downsample_echarts(option, stats, target=MAX_LINE_POINTS):
+    """Decimate large line/scatter series and note it in a "decimation" key on each series"""
+    series_list = _series_list(option)
+
+    # Series with [x, y] pairs carry their own x values
+    for index, series in enumerate(series_list):
+        data = series.get("data")
+        if series.get("type") not in ("line", "scatter") or not isinstance(data, list) or len(data) <= target:
+            continue
+        if not all(isinstance(item, list) and len(item) >= 2 for item in data):
+            continue
+        indices, method = _decimate([item[0] for item in data], [item[1] for item in data], target,
+                                    lines=series["type"] == "line")
+        if indices is None:
+            continue
+        series["data"] = [data[i] for i in indices]
+        series["decimation"] = {"method": method, "points": len(data), "kept": len(indices)}
+        _log_decimation(f"{series['type']} series {series.get('name', index)!r}", method, len(data), len(indices), stats)
+
+    # Series with plain values follow their category axis; keep the union of every series' points
+    for axis_key, index_key in (("xAxis", "xAxisIndex"), ("yAxis", "yAxisIndex")):
+        for axis_index, axis in enumerate(_axes(option, axis_key)):
+            labels = axis.get("data")
+            if not _is_array(labels) or len(labels) <= target:
+                continue
+            attached = [s for s in series_list if s.get(index_key, 0) == axis_index]
+            if not attached or not all(
+                s.get("type") in ("line", "scatter") and _is_array(s.get("data")) and len(s["data"]) == len(labels)
+                and _is_flat(s["data"])
+                for s in attached
+            ):
+                continue
+
+            picked = [_decimate(labels, s["data"], target, lines=s["type"] == "line") for s in attached]
+            if any(indices is None for indices, _ in picked):
+                continue
+            indices = np.unique(np.concatenate([indices for indices, _ in picked]))
+            axis["data"] = _subset(labels, indices)
+            for s, (_, method) in zip(attached, picked):
+                s["data"] = _subset(s["data"], indices)
+                s["decimation"] = {"method": method, "points": len(labels), "kept": len(indices)}
+            _log_decimation(
+                f"{len(attached)} series on {axis_key}[{axis_index}]", picked[0][1], len(labels), len(indices), stats
+            )
+
+
+def _show_eval_stats(stats):
+    """Show how many evaluations the spec memo and result cache saved, and any aggregation applied"""
+    for name, points, categories, size_before, size_after in stats.get("aggregated", []):
+        st.caption(
+            f"📦 Aggregated {name}: {points:,} points into {categories:,} categories "
+            f"({size_before / 1e6:,.1f} MB → {size_after / 1e3:,.1f} KB)"
+        )
+    for name, method, points, kept in stats.get("decimated", []):
+        st.caption(f"📉 Downsampled {name} with {method.upper()}: {points:,} → {kept:,} points")
+    if stats.get("cache_hits"):
+        st.caption(f"⚡ Served {stats['cache_hits']} of {stats['expressions']} expression(s) from cache")
+    elif stats.get("evaluations_saved"):
+        st.caption(
+            f"⚡ Reused {stats['evaluations_saved']} shared sub-expression(s) "
+            f"across {stats['expressions']} expression(s)"
+        )
+    if stats.get("worker_evaluations"):
+        st.caption(f"🧵 Evaluated {stats['worker_evaluations']} expression(s) in a worker process")
+    if stats.get("rollup_hits"):
+        st.caption(f"🧊 Answered {stats['rollup_hits']} groupby expression(s) from the pre-aggregated rollup")
+    if stats.get("sampled") and stats["sampled"][0]:
+        sampled, rows, total, mode = stats["sampled"]
+        st.caption(
+            f"🎲 {sampled} expression(s) computed on a {mode} sample of {rows:,} of {total:,} rows; "
+            f"values may not match totals over the whole file"
+        )
+
+
+def render_plotly_chart(spec_json, df, max_points=None):
+    """Render Plotly chart from JSON spec (line/scatter traces decimated to max_points)"""
+    import plotly.graph_objects as go
+
+    # Evaluate all Python expressions; numeric arrays go to Plotly without a JSON round trip,
+    # object ones (periods, dates) are converted as for the JSON output
+    stats = {}
+    with tracer.span("render_plotly_chart", rows=len(df)) as span:
+        with tracer.span("evaluate_spec"):
+            spec = evaluate_spec(spec_json, df, stats)
+        with tracer.span("reduce_points"):
+            _aggregate_plotly(spec, stats)
+            _downsample_plotly(spec, stats, max_points or st.session_state.get("max_chart_points", MAX_LINE_POINTS))
+        span.set(expressions=stats.get("expressions", 0), cache_hits=stats.get("cache_hits", 0),
+                 rollup_hits=stats.get("rollup_hits", 0), payload_bytes=_payload_estimate(spec))
+        with tracer.span("plot"):
+            fig = go.Figure(_json_ready(spec, keep_numeric=True))
+            st.plotly_chart(fig, use_container_width=True)
+    _show_eval_stats(stats)
+
+
+def render_echarts_chart(spec_json, df, max_points=None):
+    """Render ECharts chart from JSON option (line/scatter series decimated to max_points)"""
+    from streamlit_echarts import st_echarts
 
-    option = json.loads(processed_json)
-    st_echarts(options=option, height="500px")
+    # Evaluate all Python expressions, reduce the arrays, then hand plain lists to the component
+    stats = {}
+    with tracer.span("render_echarts_chart", rows=len(df)) as span:
+        with tracer.span("evaluate_spec"):
+            option = evaluate_spec(spec_json, df, stats)
+        with tracer.span("reduce_points"):
+            _aggregate_echarts(option, stats)
+            _downsample_echarts(option, stats, max_points or st.session_state.get("max_chart_points", MAX_LINE_POINTS))
+        span.set(expressions=stats.get("expressions", 0), cache_hits=stats.get("cache_hits", 0),
+                 rollup_hits=stats.get("rollup_hits", 0), payload_bytes=_payload_estimate(option))
+        with tracer.span("plot"):
+            st_echarts(options=_json_ready(option), height="500px")
+    _show_eval_stats(stats)
@@ -0,0 +1,166 @@
+import difflib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "chat-bi", "responses.sqlite3")
+
+# How many trailing messages identify a question (e.g. previous answer + new question)
+TAIL_MESSAGES = 3
+
+
+def normalize_text(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation (exact keys)"""
+    return " ".join(str(text).lower().split()).rstrip(".?!,;: ")
+
+
+def fuzzy_text(text):
+    """Lowercase, drop all punctuation and collapse whitespace (fuzzy candidates)"""
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return " ".join(text.split())
+
+
+def _hash(*parts):
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _cache_keys(model, messages):
+    """(exact key, context key, fuzzy-normalized question) for a message list"""
+    system = "".join(m["content"] for m in messages if m["role"] == "system")
+    conversation = [m for m in messages if m["role"] != "system"]
+    tail = conversation[-TAIL_MESSAGES:]
+    last = tail[-1]["content"] if tail else ""
+
+    base = (model, _hash(system))
+    context = [f"{m['role']}:{normalize_text(m['content'])}" for m in tail[:-1]]
+    context_key = _hash(*base, *context)
+    return _hash(context_key, normalize_text(last)), context_key, fuzzy_text(last)
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM responses in a local SQLite file.
+
+    Keyed on (model, system prompt hash, normalized conversation tail); the
+    system prompt embeds the dataset schema, so answers never leak across
+    datasets. Entries expire after ttl seconds and the least recently used
+    ones are dropped beyond max_entries. Exact keys keep operators and signs
+    ("> 1000" vs "< 1000"); in fuzzy mode a near-duplicate question with
+    punctuation stripped (difflib ratio >= threshold) in the same context
+    also hits.
+    """
+
+    def __init__(self, path=None, ttl=7 * 24 * 3600, max_entries=5_000, threshold=0.9):
+        self.path = path or os.getenv("CHATBI_RESPONSE_CACHE", DEFAULT_PATH)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, context_key TEXT, question TEXT, response TEXT,"
+                " latency REAL, created REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_context ON responses (context_key)")
+            self._ready = True
+        return conn
+
+    def lookup(self, model, messages, fuzzy=False):
+        """Return a cached response or None"""
+        key, context_key, question = _cache_keys(model, messages)
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT key, response, latency FROM responses WHERE key = ? AND created > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                fuzzy_hit = False
+                if row is None and fuzzy and question:
+                    candidates = conn.execute(
+                        "SELECT key, response, latency, question FROM responses"
+                        " WHERE context_key = ? AND created > ? ORDER BY last_used DESC LIMIT 200",
+                        (context_key, now - self.ttl)
+                    ).fetchall()
+                    best = max(
+                        candidates,
+                        key=lambda c: difflib.SequenceMatcher(None, question, c[3]).ratio(),
+                        default=None
+                    )
+                    if best is not None and difflib.SequenceMatcher(None, question, best[3]).ratio() >= self.threshold:
+                        row = best[:3]
+                        fuzzy_hit = True
+                if row is not None:
+                    conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, row[0]))
+        except sqlite3.Error:
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.fuzzy_hits += fuzzy_hit
+            self.latency_saved += row[2] or 0.0
+        return row[1]
+
+    def store(self, model, messages, response, latency):
+        """Save a response, then expire old entries and trim to max_entries"""
+        key, context_key, question = _cache_keys(model, messages)
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, context_key, question, response, latency, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM responses")
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        """Hit/miss counters for this process and the latency they saved"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved": self.latency_saved,
+            }
+
+
+response_cache = ResponseCache()
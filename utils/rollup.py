@@ -0,0 +1,325 @@
+import ast
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import pandas as pd
+from .fingerprint import dataset_fingerprint
+from .profile import get_dataset_profile
+from .tracing import tracer
+
+
+MAX_CUBES = 8
+# Categorical columns with more distinct values than this are not rolled up
+MAX_DIMENSION_GROUPS = 1_000
+
+# Aggregations the cube answers; mean is sum / count
+AGGREGATIONS = frozenset({'sum', 'count', 'min', 'max', 'mean', 'size'})
+# How each stored aggregate combines when day-level groups are rolled up
+_COMBINE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max', 'size': 'sum'}
+
+# Date granularities built for every datetime column: ("period", freq) is
+# df[col].dt.to_period(freq), (attribute,) is df[col].dt.<attribute>
+PERIOD_FREQS = {'D': 'D', 'W': 'W', 'M': 'M', 'Q': 'Q', 'Y': 'Y', 'A': 'Y'}
+DATE_ATTRIBUTES = ('year', 'quarter', 'month')
+DATE_GRANULARITIES = [('period', freq) for freq in ('D', 'W', 'M', 'Q', 'Y')] + [(attr,) for attr in DATE_ATTRIBUTES]
+
+# strftime directives a grouping format may use, finest unit last
+_STRFTIME_UNITS = {'%Y': 'Y', '%m': 'M', '%d': 'D'}
+# Groupby keywords that don't change the result of a single-key groupby
+_NEUTRAL_GROUPBY_KEYWORDS = {'observed': True, 'sort': True, 'dropna': True}
+
+
+def _constant(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _df_column(node):
+    """Column name for df["col"], else None"""
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'df':
+        return _constant(node.slice)
+    return None
+
+
+def _date_column(node):
+    """Column name for df["col"] or pd.to_datetime(df["col"], <constant options>), else None"""
+    column = _df_column(node)
+    if column is not None:
+        return column
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'to_datetime'
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == 'pd' and len(node.args) == 1
+            and all(kw.arg and kw.arg != 'utc' and isinstance(kw.value, ast.Constant) for kw in node.keywords)):
+        # Already-parsed columns come back unchanged from pd.to_datetime whatever the options
+        return _df_column(node.args[0])
+    return None
+
+
+def _strftime_granularity(fmt):
+    """("strftime", freq, fmt) when fmt names each period uniquely (e.g. "%Y-%m"), else None"""
+    if '%%' in fmt:
+        return None
+    directives = {fmt[i:i + 2] for i in range(len(fmt) - 1) if fmt[i] == '%'}
+    # Year, then month, then day: a finer unit is only unique together with the coarser ones
+    units = [directive for directive in _STRFTIME_UNITS if directive in directives]
+    if not units or directives != set(list(_STRFTIME_UNITS)[:len(units)]):
+        return None
+    return ('strftime', _STRFTIME_UNITS[units[-1]], fmt)
+
+
+def _dimension(node):
+    """(column, granularity) for a groupby key the cube can answer, else None"""
+    column = _constant(node)
+    if column is None and isinstance(node, ast.List) and len(node.elts) == 1:
+        column = _constant(node.elts[0])
+    if column is None:
+        column = _df_column(node)
+    if column is not None:
+        return column, None
+
+    # df["date"].dt.year / .dt.to_period("M") / .dt.strftime("%Y-%m")
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and not node.keywords:
+        accessor, method = node.func.value, node.func.attr
+        if len(node.args) == 1 and method in ('to_period', 'strftime'):
+            arg = _constant(node.args[0])
+            if arg is None:
+                return None
+            if method == 'to_period':
+                granularity = ('period', PERIOD_FREQS[arg]) if arg in PERIOD_FREQS else None
+            else:
+                granularity = _strftime_granularity(arg)
+        else:
+            return None
+    elif isinstance(node, ast.Attribute) and node.attr in DATE_ATTRIBUTES:
+        accessor, granularity = node.value, (node.attr,)
+    else:
+        return None
+
+    if granularity is None or not (isinstance(accessor, ast.Attribute) and accessor.attr == 'dt'):
+        return None
+    column = _date_column(accessor.value)
+    return (column, granularity) if column is not None else None
+
+
+@lru_cache(maxsize=2048)
+def match_rollup(source):
+    """
+    (column, granularity, measure, aggregation) if source is a single-key
+    groupby aggregation the cube can answer, else None.
+
+    Recognized: df.groupby(key)[measure].<sum|mean|count|min|max|size>(),
+    the same through .agg("<name>"), and df.groupby(key).size(), where key
+    is a column name, df[col], or a datetime column reduced with
+    .dt.year/.quarter/.month, .dt.to_period(freq) or .dt.strftime(fmt).
+    """
+    try:
+        node = ast.parse(source, mode='eval').body
+    except SyntaxError:
+        return None
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)) or node.keywords:
+        return None
+
+    aggregation = node.func.attr
+    if aggregation in ('agg', 'aggregate') and len(node.args) == 1:
+        aggregation = _constant(node.args[0])
+    elif node.args:
+        return None
+    if aggregation not in AGGREGATIONS:
+        return None
+
+    grouped, measure = node.func.value, None
+    if isinstance(grouped, ast.Subscript):
+        measure = _constant(grouped.slice)
+        if measure is None:
+            return None
+        grouped = grouped.value
+    elif aggregation != 'size':
+        return None
+
+    if not (isinstance(grouped, ast.Call) and isinstance(grouped.func, ast.Attribute)
+            and grouped.func.attr == 'groupby' and isinstance(grouped.func.value, ast.Name)
+            and grouped.func.value.id == 'df'):
+        return None
+    keys = list(grouped.args)
+    for kw in grouped.keywords:
+        if kw.arg == 'by':
+            keys.append(kw.value)
+        elif not (kw.arg in _NEUTRAL_GROUPBY_KEYWORDS and isinstance(kw.value, ast.Constant)
+                  and kw.value.value is _NEUTRAL_GROUPBY_KEYWORDS[kw.arg]):
+            return None
+    if len(keys) != 1:
+        return None
+
+    dimension = _dimension(keys[0])
+    if dimension is None:
+        return None
+    return dimension + (measure, aggregation)
+
+
+def _aggregate(grouped, measures):
+    """Stored aggregates of a groupby: {"sum"/"count"/"min"/"max": frame, "size": series}"""
+    table = {'size': grouped.size()}
+    if measures:
+        selected = grouped[measures]
+        table.update(sum=selected.sum(), count=selected.count(), min=selected.min(), max=selected.max())
+    return table
+
+
+def _roll_up(table, keys):
+    """Combine a finer table into the groups given by keys (one per row of the table)"""
+    return {name: getattr(values.groupby(keys, sort=True), _COMBINE[name])() for name, values in table.items()}
+
+
+class RollupCube:
+    """
+    Pre-aggregated sum, count, min, max and row count of every numeric
+    column, per low-cardinality categorical column and per date granularity.
+
+    Built once per dataset, so a chart's groupby expression is answered in
+    O(groups) instead of a pass over every row. Date columns are grouped by
+    day once and rolled up to weeks, months, quarters and years from there.
+    Answers are the Series pandas would return for the same expression
+    (index, order and name), except for last-digit rounding of float sums
+    and means.
+    """
+
+    def __init__(self, fingerprint, rows, columns, measures, tables):
+        self.fingerprint = fingerprint
+        self.rows = rows
+        self.columns = columns
+        self.measures = measures
+        self.tables = tables
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataframe(cls, df, profile, max_groups=MAX_DIMENSION_GROUPS):
+        measures = list(profile.numeric_cols)
+        dimensions = {
+            col: _aggregate(df.groupby(col, observed=True, sort=True), measures)
+            for col in profile.categorical_cols if profile.column_profiles[col].cardinality <= max_groups
+        }
+        days = {
+            col: _aggregate(df.groupby(df[col].dt.normalize(), sort=True), measures)
+            for col in profile.date_cols if getattr(df[col].dt, 'tz', None) is None
+        }
+        return cls._from_tables(profile.fingerprint, len(df), list(df.columns), measures, dimensions, days)
+
+    @classmethod
+    def from_streaming_stats(cls, df, profile, stats):
+        """
+        Cube of the exact aggregates stream_csv kept over every row read, for
+        a df that holds only a sample of them (see StreamingStats.table).
+        """
+        measures = [col for col in stats.measures if col in profile.numeric_cols]
+        dimensions = {col: stats.table(col) for col in profile.categorical_cols}
+        days = {col: stats.table(col) for col in profile.date_cols}
+        return cls._from_tables(profile.fingerprint, stats.rows, list(df.columns), measures, dimensions, days)
+
+    @classmethod
+    def _from_tables(cls, fingerprint, rows, columns, measures, dimensions, days):
+        """Cube from per-group tables of each dimension and per-day tables of each date column"""
+        tables = {(col, None): table for col, table in dimensions.items() if table is not None}
+        for col, day_table in days.items():
+            if day_table is None:
+                continue
+            day_index = day_table['size'].index
+            for granularity in DATE_GRANULARITIES:
+                if granularity[0] == 'period':
+                    keys = day_index.to_period(granularity[1])
+                else:
+                    keys = getattr(day_index, granularity[0])
+                tables[(col, granularity)] = _roll_up(day_table, keys.rename(col))
+        return cls(fingerprint, rows, columns, measures, tables)
+
+    def _table(self, column, granularity):
+        table = self.tables.get((column, granularity))
+        if table is None and granularity and granularity[0] == 'strftime':
+            # Each formatted period is a distinct label; groupby sorts the labels as text
+            periods = self.tables.get((column, ('period', granularity[1])))
+            if periods is None:
+                return None
+            index = periods['size'].index
+            table = _roll_up(periods, pd.Index(index.strftime(granularity[2]), name=index.name))
+            with self._lock:
+                self.tables[(column, granularity)] = table
+        return table
+
+    def _lookup(self, source):
+        """(table, measure, aggregation) for a groupby expression the cube can answer, else None"""
+        match = match_rollup(source)
+        if match is None:
+            return None
+        column, granularity, measure, aggregation = match
+        if measure is not None and measure not in (self.columns if aggregation == 'size' else self.measures):
+            return None
+        table = self._table(column, granularity)
+        return (table, measure, aggregation) if table is not None else None
+
+    def can_answer(self, source):
+        return self._lookup(source) is not None
+
+    def answer(self, source):
+        """The Series for a groupby expression (see match_rollup), or None if the cube can't answer it"""
+        found = self._lookup(source)
+        if found is None:
+            return None
+        table, measure, aggregation = found
+
+        if aggregation == 'size':
+            series = table['size']
+        elif aggregation == 'mean':
+            series = table['sum'][measure] / table['count'][measure]
+            if table['min'][measure].dtype.kind == 'f':
+                # pandas keeps float32 means float32
+                series = series.astype(table['min'][measure].dtype)
+        else:
+            series = table[aggregation][measure]
+        # A copy, so in-place operations later in the chain can't change the cube
+        series = series.rename(measure).copy()
+        with self._lock:
+            self.hits += 1
+        return series
+
+    def stats(self):
+        return {
+            "dimensions": len(self.tables),
+            "groups": sum(len(table['size']) for table in self.tables.values()),
+            "hits": self.hits,
+        }
+
+
+_cubes = OrderedDict()
+_cubes_lock = threading.Lock()
+
+
+def get_rollup_cube(df, build=True, stats=None):
+    """
+    Return the RollupCube for df, shared by all tabs and sessions via its fingerprint.
+
+    With build=False only an already built cube is returned (or None), so
+    callers that must not pay for a build can still use one. With stats (the
+    StreamingStats of a sampled load) the cube is built from them, so its
+    answers are exact over every row of the file rather than the sample.
+    """
+    fingerprint = dataset_fingerprint(df)
+    with _cubes_lock:
+        cube = _cubes.get(fingerprint)
+        if cube is not None:
+            _cubes.move_to_end(fingerprint)
+            return cube
+    if not build:
+        return None
+
+    profile = get_dataset_profile(df)
+    with tracer.span("build_rollup", rows=len(df)) as span:
+        if stats is None:
+            cube = RollupCube.from_dataframe(df, profile)
+        else:
+            cube = RollupCube.from_streaming_stats(df, profile, stats)
+        span.set(**cube.stats())
+    with _cubes_lock:
+        _cubes[fingerprint] = cube
+        while len(_cubes) > MAX_CUBES:
+            _cubes.popitem(last=False)
+    return cube
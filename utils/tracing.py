@@ -0,0 +1,247 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import streamlit as st
+
+
+# Finished spans kept in memory per process
+MAX_SPANS = 5_000
+# Optional JSON-lines file every finished span is appended to (for log shipping)
+TRACE_FILE = os.getenv("CHATBI_TRACE_FILE")
+SERVICE_NAME = "chat-bi"
+
+_current_span = contextvars.ContextVar("chatbi_current_span", default=None)
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        return None
+    return ctx.session_id if ctx is not None else None
+
+
+class Span:
+    """
+    One timed operation. attributes carry what was processed (rows, bytes,
+    tokens, cache hits); error is set when the operation raised.
+    """
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.duration = None
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def end_ns(self):
+        return self.start_ns + int((self.duration or 0.0) * 1e9)
+
+    def to_record(self):
+        """Flat JSON-serializable record (one line of the JSONL export)"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Records nested spans per request.
+
+    The current span lives in a context variable, so spans opened inside
+    another become its children (also on the LLM pool, which runs jobs in a
+    copy of the submitting context). A span without a parent starts a new
+    trace unless trace_id ties it to an earlier one, e.g. rendering the chart
+    a completion produced. Finished spans go to a bounded in-memory buffer
+    and, when configured, a JSON-lines file.
+    """
+
+    def __init__(self, max_spans=MAX_SPANS, path=TRACE_FILE):
+        self.path = path
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def start(self, name, trace_id=None, **attributes):
+        """Open a span under the current one without making it current; close it with end()"""
+        parent = _current_span.get()
+        if parent is not None and trace_id in (None, parent.trace_id):
+            return Span(name, parent.trace_id, parent.span_id, attributes)
+        attributes.setdefault("session", _session_id())
+        return Span(name, trace_id or secrets.token_hex(16), None, attributes)
+
+    def end(self, span, error=None):
+        span.duration = time.perf_counter() - span._start
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._spans.append(span)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(span.to_record(), default=str) + "\n")
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """Time the enclosed block as a span; nested spans become its children"""
+        span = self.start(name, trace_id, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end(span, error)
+
+    def spans(self, trace_ids=None):
+        """Finished spans, oldest first, optionally only those of the given traces"""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_ids is not None:
+            spans = [s for s in spans if s.trace_id in trace_ids]
+        return spans
+
+    def traces(self, session=None, limit=10):
+        """
+        The latest limit traces as {trace_id: [spans]}, newest first.
+
+        With session, only traces started in that Streamlit session are
+        returned (their root spans carry the session id).
+        """
+        grouped = OrderedDict()
+        for span in self.spans():
+            grouped.setdefault(span.trace_id, []).append(span)
+        if session is not None:
+            grouped = OrderedDict(
+                (trace_id, spans) for trace_id, spans in grouped.items()
+                if any(s.parent_id is None and s.attributes.get("session") == session for s in spans)
+            )
+        latest = sorted(grouped.items(), key=lambda item: max(s.end_ns for s in item[1]), reverse=True)
+        return OrderedDict(latest[:limit])
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+tracer = Tracer()
+
+
+def to_jsonl(spans):
+    """Spans as JSON lines, one flat record per span"""
+    return "".join(json.dumps(span.to_record(), default=str) + "\n" for span in spans)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans, service_name=SERVICE_NAME):
+    """Spans in the OpenTelemetry OTLP/JSON trace format (ExportTraceServiceRequest)"""
+    otlp_spans = []
+    for span in spans:
+        record = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": f"chatbi.{key}", "value": _otlp_value(value)}
+                for key, value in span.attributes.items() if value is not None
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            record["parentSpanId"] = span.parent_id
+        otlp_spans.append(record)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "chatbi.tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+def _trace_rows(spans):
+    """Spans of one trace in tree order, names indented by depth"""
+    children = {}
+    for span in spans:
+        children.setdefault(span.parent_id, []).append(span)
+    ids = {span.span_id for span in spans}
+    # Reruns add a new root (e.g. rendering the same chart again); show the latest of each
+    latest = OrderedDict()
+    for span in sorted(spans, key=lambda s: s.start_ns):
+        if span.parent_id is None or span.parent_id not in ids:
+            previous = latest.get(span.name)
+            latest[span.name] = (span, previous[1] + 1 if previous else 1)
+
+    rows = []
+
+    def visit(span, depth, runs=1):
+        attributes = {k: v for k, v in span.attributes.items() if k != "session" and v is not None}
+        if runs > 1:
+            attributes["runs"] = runs
+        rows.append({
+            "span": "  " * depth + span.name,
+            "ms": round((span.duration or 0.0) * 1000, 1),
+            "details": ", ".join(f"{k}={v}" for k, v in attributes.items()) + (f" ⚠ {span.error}" if span.error else ""),
+        })
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.start_ns):
+            visit(child, depth + 1)
+
+    for root, runs in sorted(latest.values(), key=lambda item: item[0].start_ns):
+        visit(root, 0, runs)
+    return rows
+
+
+def render_trace_panel(limit=5):
+    """Sidebar panel with the latest traces of this session and JSONL/OTLP downloads"""
+    traces = tracer.traces(session=_session_id(), limit=limit)
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        if not traces:
+            st.caption("No traces yet - ask a question to record one.")
+            return
+        for spans in traces.values():
+            roots = [s for s in spans if s.parent_id is None]
+            root = roots[0] if roots else spans[0]
+            label = root.attributes.get("tab") or root.attributes.get("source") or ""
+            st.markdown(f"**{root.name}** {label} · {len(spans)} span(s)")
+            st.dataframe(_trace_rows(spans), hide_index=True, use_container_width=True)
+
+        spans = [span for trace_spans in traces.values() for span in trace_spans]
+        st.download_button("Download JSONL", to_jsonl(spans), file_name="chatbi-traces.jsonl", mime="application/jsonl")
+        st.download_button(
+            "Download OTLP JSON", json.dumps(to_otlp(spans), default=str),
+            file_name="chatbi-traces.otlp.json", mime="application/json"
+        )